@@ -1,4 +1,6 @@
 import os
+import hashlib
+import time
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 import jwt
@@ -6,6 +8,7 @@ from datetime import datetime, timedelta
 from typing import Dict, List
 from database import get_db, User as UserModel
 from sqlalchemy.orm import Session
+from cache import TTLCache
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 ALGORITHM = "HS256"
@@ -14,6 +17,12 @@ REFRESH_TOKEN_EXPIRE_DAYS = 7
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/login")
 
+# Har bir worker o'z keshiga ega; boshqa workerlardagi o'zgarishlar TTL tugagach ko'rinadi
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+token_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL_SECONDS)
+principal_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL_SECONDS)
+
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -35,15 +44,37 @@ def decode_token(token: str) -> Dict:
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+def decode_token_cached(token: str) -> Dict:
+    key = hashlib.sha256(token.encode()).hexdigest()
+    payload = token_cache.get(key)
+    if payload is None:
+        payload = decode_token(token)
+        token_cache.set(key, payload)
+    elif payload.get("exp", 0) <= time.time():
+        token_cache.pop(key)
+        raise HTTPException(status_code=401, detail="Token has expired")
+    return payload
+
+def invalidate_user(user_id: str):
+    principal_cache.pop(user_id)
+
+def auth_cache_stats() -> Dict:
+    return {"tokens": token_cache.stats(), "principals": principal_cache.stats()}
+
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> Dict:
-    payload = decode_token(token)
+    payload = decode_token_cached(token)
     if payload.get("type") != "access":
         raise HTTPException(status_code=401, detail="Invalid token type")
     user_id = payload.get("sub")
-    user = db.query(UserModel).filter_by(id=user_id).first()
+    principal = principal_cache.get(user_id)
+    if principal is not None:
+        return dict(principal)
+    user = db.query(UserModel.id, UserModel.role, UserModel.lat, UserModel.lon).filter_by(id=user_id).first()
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
-    return {"id": user.id, "role": user.role, "lat": user.lat, "lon": user.lon}
+    principal = {"id": user.id, "role": user.role, "lat": user.lat, "lon": user.lon}
+    principal_cache.set(user_id, principal)
+    return dict(principal)
 
 def check_role(roles: List[str]):
     def role_checker(current_user: Dict = Depends(get_current_user)):
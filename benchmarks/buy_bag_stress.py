@@ -0,0 +1,94 @@
+"""Concurrent stress benchmark for bag reservation.
+
+Hammers a single bag from many threads through the same reserve/stats/commit
+path that buy_bag uses and checks that nothing was oversold or miscounted:
+
+    python -m benchmarks.buy_bag_stress --threads 32 --quantity 2000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--quantity", type=int, default=1000, help="units available on the hot bag")
+    parser.add_argument("--database-url", default=None, help="defaults to a throwaway SQLite file")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        tmpdir = tempfile.mkdtemp(prefix="surplus-bench-")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+
+    # DATABASE_URL o'rnatilgandan keyingina import qilinadi
+    from sqlalchemy.exc import OperationalError
+    from database import Base, engine, SessionLocal, User, Bag, Order, StatCounter
+    from inventory import reserve_bag
+    import stats
+
+    Base.metadata.create_all(bind=engine)
+    run_id = uuid.uuid4().hex[:8]
+    shop_id, bag_id = f"bench-shop-{run_id}", f"bench-bag-{run_id}"
+    customers = [f"bench-customer-{run_id}-{i}" for i in range(args.threads)]
+    with SessionLocal() as db:
+        db.add(User(id=shop_id, name="Bench shop", email=f"{shop_id}@bench", password="x", role="shop", lat=0, lon=0))
+        for customer_id in customers:
+            db.add(User(id=customer_id, name="Bench customer", email=f"{customer_id}@bench", password="x",
+                        role="customer", lat=0, lon=0))
+        db.flush()
+        db.add(Bag(id=bag_id, shop_id=shop_id, description="Hot bag", price=1, quantity=args.quantity,
+                   pickup_start="now", pickup_end="later", category="bench"))
+        db.commit()
+        # Hisoblagich bazadagi oldingi ishga tushirishlarni ham o'z ichiga oladi
+        counted_before = db.query(StatCounter.value).filter_by(name="orders_placed").scalar() or 0
+
+    placed = [0] * args.threads
+    errors = [0] * args.threads
+    start_barrier = threading.Barrier(args.threads)
+
+    def buyer(n: int):
+        start_barrier.wait()
+        while True:
+            with SessionLocal() as db:
+                try:
+                    if not reserve_bag(db, bag_id):
+                        return
+                    db.add(Order(id=str(uuid.uuid4()), customer_id=customers[n], bag_id=bag_id))
+                    # buy_bag bilan bir xil: hisoblagich qatorlari ham shu tranzaksiyada yangilanadi
+                    stats.record_order_event(db, "orders_placed", shop_id, "bench")
+                    db.commit()
+                    placed[n] += 1
+                except OperationalError:
+                    db.rollback()
+                    errors[n] += 1
+
+    threads = [threading.Thread(target=buyer, args=(n,)) for n in range(args.threads)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    with SessionLocal() as db:
+        bag = db.query(Bag).filter_by(id=bag_id).one()
+        orders = db.query(Order).filter_by(bag_id=bag_id).count()
+        counted = (db.query(StatCounter.value).filter_by(name="orders_placed").scalar() or 0) - counted_before
+    total = sum(placed)
+    ok = orders == total == counted == args.quantity and bag.quantity == 0 and bag.status == "sold"
+    print(f"threads={args.threads} quantity={args.quantity} elapsed={elapsed:.3f}s")
+    print(f"orders={orders} placed={total} orders_placed_counter={counted} lock_errors={sum(errors)} "
+          f"orders_per_sec={total / elapsed:.1f}")
+    print(f"final quantity={bag.quantity} status={bag.status} -> {'OK' if ok else 'FAILED'}")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
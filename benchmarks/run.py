@@ -0,0 +1,270 @@
+"""Endpoint benchmark runner.
+
+Drives the API either in-process (FastAPI TestClient, needs httpx) or over
+HTTP against a local uvicorn (--url), using the manifest written by
+benchmarks/seed.py. Reports throughput and p50/p95/p99 latency per scenario
+and can compare against a stored baseline:
+
+    python -m benchmarks.seed --database-url sqlite:////tmp/bench.db
+    python -m benchmarks.run --database-url sqlite:////tmp/bench.db --json results.json
+    python -m benchmarks.run --url http://127.0.0.1:8000 --baseline results.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from math import ceil
+from typing import Callable, Dict, List, Optional, Tuple
+
+from benchmarks.seed import DEFAULT_MANIFEST
+
+SCENARIOS = ("browse_nearby", "browse_category", "browse_price", "search", "shop_bags", "reviews",
+             "bag_status", "orders", "buy", "login", "statistics")
+DEFAULT_SCENARIOS = ("browse_nearby", "browse_category", "browse_price", "search", "shop_bags", "reviews",
+                     "bag_status", "orders", "buy", "login")
+SEARCH_TERMS = ("bread", "halal", "plov", "cheese", "fruit", "cake", "non", "samsa")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=None, help="base URL of a running server; in-process if omitted")
+    parser.add_argument("--database-url", default=None, help="DATABASE_URL for in-process runs")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    parser.add_argument("--scenarios", default=",".join(DEFAULT_SCENARIOS),
+                        help=f"comma separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=300, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=10, help="unmeasured requests per scenario")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", dest="json_path", default=None, help="write results as JSON")
+    parser.add_argument("--baseline", default=None, help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression (0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+class HttpClient:
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+
+    def request(self, method: str, path: str, params: Optional[dict] = None, form: Optional[dict] = None,
+                headers: Optional[dict] = None) -> Tuple[int, object]:
+        url = self.base_url + path
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+        data = urllib.parse.urlencode(form).encode() if form else None
+        req = urllib.request.Request(url, data=data, method=method, headers=headers or {})
+        if form:
+            req.add_header("Content-Type", "application/x-www-form-urlencoded")
+        try:
+            with urllib.request.urlopen(req) as response:
+                return response.status, _json(response.read())
+        except urllib.error.HTTPError as exc:
+            return exc.code, _json(exc.read())
+
+class InProcessClient:
+    def __init__(self):
+        from fastapi.testclient import TestClient
+        import main
+        self.client = TestClient(main.app)
+
+    def request(self, method: str, path: str, params: Optional[dict] = None, form: Optional[dict] = None,
+                headers: Optional[dict] = None) -> Tuple[int, object]:
+        response = self.client.request(method, path, params=params, data=form, headers=headers)
+        return response.status_code, _json(response.content)
+
+def _json(body: bytes):
+    try:
+        return json.loads(body) if body else None
+    except ValueError:
+        return None
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = max(0, ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+class Workload:
+    """Builds randomized requests for each scenario from the seed manifest."""
+
+    def __init__(self, client, manifest: dict, rng: random.Random):
+        self.client = client
+        self.manifest = manifest
+        self.rng = rng
+        self._tokens: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.bag_ids: List[str] = []
+
+    def login(self, email: str) -> Tuple[int, object]:
+        return self.client.request("POST", "/users/login",
+                                   form={"username": email, "password": self.manifest["password"]})
+
+    def customer(self) -> Tuple[str, dict]:
+        customer = self.rng.choice(self.manifest["customers"][:50])
+        with self._lock:
+            token = self._tokens.get(customer["id"])
+        if token is None:
+            _, body = self.login(customer["email"])
+            token = body["access_token"]
+            with self._lock:
+                self._tokens[customer["id"]] = token
+        return customer["id"], {"Authorization": f"Bearer {token}"}
+
+    def admin(self) -> dict:
+        _, body = self.client.request("POST", "/users/login",
+                                      form={"username": "admin@example.com", "password": "adminpass"})
+        return {"Authorization": f"Bearer {body['access_token']}"}
+
+    def origin(self) -> Tuple[float, float]:
+        lat, lon = self.rng.choice(self.manifest["cities"])
+        return lat + self.rng.uniform(-0.05, 0.05), lon + self.rng.uniform(-0.05, 0.05)
+
+    def prepare(self):
+        lat, lon = self.origin()
+        _, bags = self.client.request("GET", "/bags", params={"lat": lat, "lon": lon, "radius": 20, "limit": 200})
+        self.bag_ids = [bag["id"] for bag in bags or []]
+        # Tokenlar oldindan olinadi, aks holda bcrypt boshqa stsenariylar vaqtiga qo'shiladi
+        for _ in range(5):
+            self.customer()
+
+    def request_for(self, scenario: str) -> Callable[[], Tuple[int, object]]:
+        rng, client = self.rng, self.client
+        if scenario == "browse_nearby":
+            lat, lon = self.origin()
+            return lambda: client.request("GET", "/bags", params={"lat": lat, "lon": lon, "radius": 5,
+                                                                  "sort_by": "distance", "limit": 50})
+        if scenario == "browse_category":
+            category = rng.choice(self.manifest["categories"])
+            return lambda: client.request("GET", "/bags", params={"category": category, "limit": 50})
+        if scenario == "browse_price":
+            return lambda: client.request("GET", "/bags", params={"sort_by": "price", "limit": 50})
+        if scenario == "search":
+            lat, lon = self.origin()
+            q = rng.choice(SEARCH_TERMS)
+            return lambda: client.request("GET", "/bags", params={"q": q, "lat": lat, "lon": lon, "radius": 10,
+                                                                  "limit": 50})
+        if scenario == "shop_bags":
+            shop_id = rng.choice(self.manifest["shops"])
+            return lambda: client.request("GET", f"/shops/{shop_id}/bags", params={"limit": 50})
+        if scenario == "reviews":
+            shop_id = rng.choice(self.manifest["shops"])
+            return lambda: client.request("GET", f"/shops/{shop_id}/reviews", params={"limit": 50})
+        if scenario == "bag_status":
+            bag_id = rng.choice(self.bag_ids) if self.bag_ids else "missing"
+            return lambda: client.request("GET", f"/bags/{bag_id}/status")
+        if scenario == "orders":
+            customer_id, headers = self.customer()
+            return lambda: client.request("GET", f"/customers/{customer_id}/orders", params={"limit": 50},
+                                          headers=headers)
+        if scenario == "buy":
+            customer_id, headers = self.customer()
+            bag_id = rng.choice(self.bag_ids) if self.bag_ids else "missing"
+            return lambda: client.request("POST", f"/customers/{customer_id}/buy/{bag_id}", headers=headers)
+        if scenario == "login":
+            customer = rng.choice(self.manifest["customers"])
+            return lambda: self.login(customer["email"])
+        if scenario == "statistics":
+            headers = self.admin()
+            return lambda: client.request("GET", "/admin/statistics", headers=headers)
+        raise ValueError(f"Unknown scenario {scenario}")
+
+# 404 (sotilgan sumka) xarid stsenariysida kutilgan natija
+EXPECTED_STATUSES = {"buy": (200, 404)}
+
+def run_scenario(workload: Workload, scenario: str, requests: int, concurrency: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        workload.request_for(scenario)()
+    calls = [workload.request_for(scenario) for _ in range(requests)]
+    latencies: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+    cursor = iter(calls)
+    expected = EXPECTED_STATUSES.get(scenario, (200,))
+
+    def worker():
+        while True:
+            with lock:
+                call = next(cursor, None)
+            if call is None:
+                return
+            started = time.perf_counter()
+            status, _ = call()
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed)
+                if status not in expected:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Returns human readable regressions of p95 latency or throughput beyond tolerance."""
+    regressions = []
+    for scenario, current in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(scenario)
+        if not base:
+            continue
+        if base["p95_ms"] and current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{scenario}: p95 {base['p95_ms']}ms -> {current['p95_ms']}ms")
+        if base["throughput_rps"] and current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{scenario}: throughput {base['throughput_rps']} -> {current['throughput_rps']} req/s")
+    return regressions
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    client = HttpClient(args.url) if args.url else InProcessClient()
+    workload = Workload(client, manifest, random.Random(args.seed))
+    workload.prepare()
+    results = {"target": args.url or "in-process", "concurrency": args.concurrency,
+               "requests_per_scenario": args.requests, "seed": args.seed, "scenarios": {}}
+    print(f"{'scenario':<20}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for scenario in scenarios:
+        stats = run_scenario(workload, scenario, args.requests, args.concurrency, args.warmup)
+        results["scenarios"][scenario] = stats
+        print(f"{scenario:<20}{stats['throughput_rps']:>10}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+              f"{stats['p99_ms']:>10}{stats['errors']:>8}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""Seeded synthetic data generator for benchmarks.
+
+Fills DATABASE_URL (default: surplus_saver.db) with shops spread around a few
+city centres, customers, bags, orders and reviews, and writes a manifest that
+benchmarks/run.py uses to build requests:
+
+    python -m benchmarks.seed --shops 2000 --customers 5000 --seed 42
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from math import cos, radians
+
+DEFAULT_MANIFEST = os.path.join(os.path.dirname(os.path.abspath(__file__)), "manifest.json")
+BENCH_PASSWORD = "benchpass"
+# Toshkent, Samarqand, Buxoro, Namangan
+DEFAULT_CITIES = "41.311,69.280;39.654,66.975;39.767,64.421;40.998,71.672"
+CATEGORIES = ["bakery", "grocery", "restaurant", "cafe", "produce", "dairy", "halal", "sweets"]
+ITEMS = {
+    "bakery": ["bread", "non", "croissants", "buns", "baguette"],
+    "grocery": ["mixed groceries", "canned goods", "snacks", "pasta"],
+    "restaurant": ["plov", "lagman", "shashlik", "samsa", "manti"],
+    "cafe": ["sandwiches", "pastries", "salads", "coffee and cake"],
+    "produce": ["fruit box", "vegetables", "herbs", "melons"],
+    "dairy": ["yogurt", "cheese", "milk", "kefir"],
+    "halal": ["halal meat", "halal sausages", "halal ready meals"],
+    "sweets": ["halva", "cakes", "cookies", "chak-chak"],
+}
+CHUNK = 1000
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=None, help="defaults to the app's DATABASE_URL")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--shops", type=int, default=500)
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--bags-per-shop", type=int, default=5)
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--reviews", type=int, default=3000)
+    parser.add_argument("--cities", default=DEFAULT_CITIES, help="'lat,lon;lat,lon;...' cluster centres")
+    parser.add_argument("--spread-km", type=float, default=8.0, help="std deviation of shop/customer spread")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    return parser.parse_args(argv)
+
+def _point(rng: random.Random, cities, spread_km: float):
+    lat, lon = rng.choice(cities)
+    dlat = rng.gauss(0, spread_km) / 111.195
+    dlon = rng.gauss(0, spread_km) / (111.195 * cos(radians(lat)))
+    return round(lat + dlat, 6), round(lon + dlon, 6)
+
+def _insert(db, model, rows):
+    from sqlalchemy import insert
+    for i in range(0, len(rows), CHUNK):
+        db.execute(insert(model), rows[i:i + CHUNK])
+
+def seed(args) -> dict:
+    from database import (SessionLocal, User, Bag, Order, Review, StatCounter, StatRollup, ShopRating,
+                          init_db, increment, pwd_context)
+    import search
+    init_db()
+    with SessionLocal() as db:
+        search.ensure_index(db)
+    rng = random.Random(args.seed)
+    cities = [tuple(float(x) for x in city.split(",")) for city in args.cities.split(";")]
+    prefix = f"seed{args.seed}"
+    # Bitta xesh hamma foydalanuvchilar uchun: minglab bcrypt chaqiruvi kerak emas
+    password = pwd_context.hash(BENCH_PASSWORD)
+    now = datetime.utcnow().replace(second=0, microsecond=0)
+
+    with SessionLocal() as db:
+        if db.query(User.id).filter_by(id=f"{prefix}-shop-0").first():
+            raise SystemExit(f"Data for seed {args.seed} already exists; use another --seed or a fresh database")
+
+        shops, customers = [], []
+        for i in range(args.shops):
+            lat, lon = _point(rng, cities, args.spread_km)
+            shops.append({"id": f"{prefix}-shop-{i}", "name": f"Shop {i}", "email": f"{prefix}-shop-{i}@bench.local",
+                          "password": password, "role": "shop", "lat": lat, "lon": lon, "approved": 1})
+        for i in range(args.customers):
+            lat, lon = _point(rng, cities, args.spread_km)
+            customers.append({"id": f"{prefix}-customer-{i}", "name": f"Customer {i}",
+                              "email": f"{prefix}-customer-{i}@bench.local", "password": password,
+                              "role": "customer", "lat": lat, "lon": lon, "approved": 0})
+        _insert(db, User, shops + customers)
+
+        bags = []
+        for shop in shops:
+            for j in range(rng.randint(max(1, args.bags_per_shop // 2), args.bags_per_shop * 3 // 2 or 1)):
+                category = rng.choice(CATEGORIES)
+                start = now - timedelta(hours=rng.randint(0, 3))
+                end = now + timedelta(minutes=rng.randint(30, 12 * 60))
+                bags.append({"id": f"{shop['id']}-bag-{j}", "shop_id": shop["id"], "category": category,
+                             "description": f"{rng.choice(ITEMS[category]).capitalize()} surprise bag",
+                             "price": round(rng.uniform(0.5, 15), 2), "quantity": rng.randint(1, 20),
+                             "pickup_start": start.isoformat(timespec="minutes") + "Z",
+                             "pickup_end": end.isoformat(timespec="minutes") + "Z", "pickup_start_at": start,
+                             "pickup_end_at": end, "status": "available"})
+
+        orders, events = [], Counter()
+        open_bags = list(bags)
+        statuses = ["pending"] * 3 + ["picked_up"] * 6 + ["cancelled"]
+        for i in range(args.orders):
+            if not open_bags:
+                break
+            k = rng.randrange(len(open_bags))
+            bag = open_bags[k]
+            status = rng.choice(statuses)
+            orders.append({"id": f"{prefix}-order-{i}", "customer_id": rng.choice(customers)["id"],
+                           "bag_id": bag["id"], "status": status})
+            events[(bag["shop_id"], bag["category"], "orders_placed")] += 1
+            if status != "pending":
+                events[(bag["shop_id"], bag["category"], f"orders_{status}")] += 1
+            if status != "cancelled":
+                bag["quantity"] -= 1
+                if bag["quantity"] == 0:
+                    bag["status"] = "sold"
+                    open_bags[k] = open_bags[-1]
+                    open_bags.pop()
+        _insert(db, Bag, bags)
+        # Faqat sotuvdagi sumkalar indekslanadi (ilova qidiruv indeksini shu to'plamda ushlab turadi)
+        searchable = [bag for bag in bags if bag["status"] == "available"]
+        for i in range(0, len(searchable), CHUNK):
+            search.index_bags(db, searchable[i:i + CHUNK], replace=False)
+        _insert(db, Order, orders)
+
+        reviews, summaries = [], defaultdict(Counter)
+        for i in range(args.reviews):
+            shop = rng.choice(shops)
+            rating = rng.choices([1, 2, 3, 4, 5], weights=[1, 1, 3, 6, 8])[0]
+            reviews.append({"id": f"{prefix}-review-{i}", "customer_id": rng.choice(customers)["id"],
+                            "shop_id": shop["id"], "rating": rating, "comment": rng.choice(["", "Great value", "Fresh", "OK"])})
+            summaries[shop["id"]][rating] += 1
+        _insert(db, Review, reviews)
+
+        # Hisoblagichlar va reytinglar ilova yangilaydigan jadvallarga mos bo'lishi uchun
+        hour = now.replace(minute=0)
+        for (shop_id, category, metric), n in events.items():
+            increment(db, StatCounter, {"name": metric}, {"value": n})
+            for granularity, bucket in (("hour", hour), ("day", hour.replace(hour=0))):
+                increment(db, StatRollup, {"granularity": granularity, "bucket": bucket, "shop_id": shop_id,
+                                           "category": category}, {metric: n})
+        for shop_id, histogram in summaries.items():
+            increment(db, ShopRating, {"shop_id": shop_id},
+                      {"count": sum(histogram.values()), "sum": sum(r * n for r, n in histogram.items()),
+                       **{f"r{r}": n for r, n in histogram.items()}})
+        db.commit()
+
+    return {
+        "seed": args.seed,
+        "password": BENCH_PASSWORD,
+        "cities": cities,
+        "categories": CATEGORIES,
+        "shops": [shop["id"] for shop in shops],
+        "customers": [{"id": c["id"], "email": c["email"]} for c in customers],
+        "counts": {"shops": len(shops), "customers": len(customers), "bags": len(bags),
+                   "orders": len(orders), "reviews": len(reviews)},
+    }
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    started = time.perf_counter()
+    manifest = seed(args)
+    with open(args.manifest, "w") as f:
+        json.dump(manifest, f)
+    print(f"seeded {manifest['counts']} in {time.perf_counter() - started:.1f}s -> {args.manifest}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+import codecs
+import csv
+import json
+import os
+import uuid
+from typing import AsyncIterator, Dict, List, Tuple
+
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from database import Bag as BagModel
+from inventory import reopen_expired
+from models import Bag
+from pickup import pickup_columns, utcnow
+import search
+
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+BAG_FIELDS = tuple(Bag.model_fields)
+
+async def _iter_lines(request: Request) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    async for chunk in request.stream():
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+async def _iter_ndjson(request: Request) -> AsyncIterator[object]:
+    async for line in _iter_lines(request):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield None
+
+async def _iter_csv(request: Request) -> AsyncIterator[object]:
+    header, pending = None, ""
+    async for line in _iter_lines(request):
+        pending = f"{pending}\n{line}" if pending else line
+        # Qo'shtirnoq ichidagi yangi qator: yozuv hali tugamagan
+        if pending.count('"') % 2:
+            continue
+        record, pending = next(csv.reader([pending]), []), ""
+        if header is None:
+            header = [name.strip() for name in record]
+            continue
+        if record:
+            yield dict(zip(header, record))
+
+async def iter_rows(request: Request) -> AsyncIterator[object]:
+    """Yields raw rows from a JSON array, or streams them from CSV/NDJSON bodies."""
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip()
+    if content_type == "text/csv":
+        rows = _iter_csv(request)
+    elif content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl"):
+        rows = _iter_ndjson(request)
+    elif content_type == "application/json":
+        try:
+            payload = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON body")
+        if not isinstance(payload, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array of bags")
+        for row in payload:
+            yield row
+        return
+    else:
+        raise HTTPException(status_code=415, detail="Use application/json, application/x-ndjson or text/csv")
+    async for row in rows:
+        yield row
+
+async def iter_chunks(request: Request, size: int = BULK_CHUNK_SIZE) -> AsyncIterator[List[Tuple[int, object]]]:
+    chunk = []
+    row_number = 0
+    async for row in iter_rows(request):
+        row_number += 1
+        chunk.append((row_number, row))
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def apply_chunk(db: Session, shop_id: str, chunk: List[Tuple[int, object]]) -> Tuple[List[Dict], List[Dict]]:
+    """Validates a chunk, writes it with one executemany per operation and commits.
+
+    Returns per-row results and the committed bag changes (for events/caches).
+    """
+    results, inserts, updates = [], [], []
+    for row_number, row in chunk:
+        if not isinstance(row, dict):
+            results.append({"row": row_number, "status": "error", "errors": [{"loc": [], "msg": "Row is not an object"}]})
+            continue
+        bag_id = row.get("id") or None
+        try:
+            bag = Bag(**{name: row[name] for name in BAG_FIELDS if name in row})
+        except ValidationError as exc:
+            results.append({"row": row_number, "status": "error", "id": bag_id,
+                            "errors": [{"loc": list(err["loc"]), "msg": err["msg"]} for err in exc.errors()]})
+            continue
+        values = {**bag.dict(), **pickup_columns(bag.pickup_start, bag.pickup_end)}
+        if bag_id:
+            updates.append((row_number, {"id": bag_id, **values}))
+        else:
+            inserts.append((row_number, {"id": str(uuid.uuid4()), "shop_id": shop_id, **values}))
+
+    existing = {}
+    if updates:
+        ids = [values["id"] for _, values in updates]
+        existing = {row.id: row for row in db.query(BagModel.id, BagModel.category, BagModel.status)
+                    .filter(BagModel.shop_id == shop_id, BagModel.id.in_(ids))}
+        missing = [(n, values) for n, values in updates if values["id"] not in existing]
+        for row_number, values in missing:
+            results.append({"row": row_number, "status": "error", "id": values["id"],
+                            "errors": [{"loc": ["id"], "msg": "Bag not found"}]})
+        updates = [(n, values) for n, values in updates if values["id"] in existing]
+
+    if inserts:
+        db.execute(insert(BagModel), [values for _, values in inserts])
+        search.index_bags(db, [values for _, values in inserts], replace=False)
+    if updates:
+        db.execute(update(BagModel), [values for _, values in updates])
+        expired = [values["id"] for _, values in updates if existing[values["id"]].status == "expired"]
+        if expired:
+            reopen_expired(db, expired)
+        # Qayta ochilganlar indeksga qaytadi, sotilgan/muddati o'tganlar indeksdan tashqarida qoladi
+        search.sync_bags(db, [values["id"] for _, values in updates])
+    db.commit()
+
+    changes = []
+    for row_number, values in inserts:
+        results.append({"row": row_number, "status": "created", "id": values["id"]})
+        changes.append({"event": "created", "status": "available", "previous_category": None, **values})
+    now = utcnow()
+    for row_number, values in updates:
+        previous = existing[values["id"]]
+        status = previous.status
+        if status == "expired" and values["quantity"] > 0 and values["pickup_end_at"] and values["pickup_end_at"] > now:
+            status = "available"
+        results.append({"row": row_number, "status": "updated", "id": values["id"]})
+        changes.append({"event": "updated", "shop_id": shop_id, "status": status,
+                        "previous_category": previous.category, **values})
+    results.sort(key=lambda result: result["row"])
+    return results, changes
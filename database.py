@@ -1,16 +1,50 @@
 import os
-from sqlalchemy import create_engine, Column, String, Float, Integer, Text, ForeignKey
+from sqlalchemy import create_engine, event, inspect, text, Column, String, Float, Integer, Text, DateTime, ForeignKey, Index, func, insert, update
+from sqlalchemy.dialects import sqlite, postgresql
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from passlib.context import CryptContext
 import uuid
+from datetime import datetime
 
 # SQLite bilan ishlash uchun DATABASE_URL
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///surplus_saver.db")
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+
+# Engine profili: SQLite uchun PRAGMA'lar, server bazalari uchun ulanishlar hovuzi
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # manfiy qiymat = KiB
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+def _engine_options(url: str) -> dict:
+    if url.startswith("sqlite"):
+        return {"connect_args": {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}}
+    return {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW,
+            "pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+        cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt narxi o'zgarsa, eski xeshlar login paytida qayta xeshlanadi
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 class User(Base):
     __tablename__ = "users"
@@ -22,6 +56,11 @@ class User(Base):
     lat = Column(Float)
     lon = Column(Float)
     approved = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        # Radius bo'yicha qidiruvdagi bounding box filtri uchun
+        Index("ix_users_lat_lon", "lat", "lon"),
+    )
 
 class Bag(Base):
     __tablename__ = "bags"
@@ -32,8 +71,17 @@ class Bag(Base):
     quantity = Column(Integer, nullable=False)
     pickup_start = Column(String, nullable=False)
     pickup_end = Column(String, nullable=False)
+    # Satr maydonlaridan ajratib olingan vaqtlar (UTC); filtr va muddati o'tish shular bo'yicha
+    pickup_start_at = Column(DateTime)
+    pickup_end_at = Column(DateTime)
     category = Column(String, nullable=False)
     status = Column(String, default="available")
+    created_at = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        Index("ix_bags_status_category", "status", "category"),
+        Index("ix_bags_shop_status", "shop_id", "status"),
+        Index("ix_bags_status_pickup_end", "status", "pickup_end_at"),
+    )
 
 class Order(Base):
     __tablename__ = "orders"
@@ -41,6 +89,11 @@ class Order(Base):
     customer_id = Column(String, ForeignKey("users.id"), nullable=False)
     bag_id = Column(String, ForeignKey("bags.id"), nullable=False)
     status = Column(String, default="pending")
+    created_at = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        Index("ix_orders_customer_status", "customer_id", "status"),
+        Index("ix_orders_bag_status", "bag_id", "status"),
+    )
 
 class Review(Base):
     __tablename__ = "reviews"
@@ -49,10 +102,141 @@ class Review(Base):
     shop_id = Column(String, ForeignKey("users.id"), nullable=False)
     rating = Column(Integer, nullable=False)
     comment = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        Index("ix_reviews_shop", "shop_id"),
+    )
+
+# Statistika hisoblagichlari buyurtma tranzaksiyasi ichida yangilanadi
+class StatCounter(Base):
+    __tablename__ = "stat_counters"
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+class StatRollup(Base):
+    __tablename__ = "stat_rollups"
+    granularity = Column(String, primary_key=True)  # "hour" yoki "day"
+    bucket = Column(DateTime, primary_key=True)
+    shop_id = Column(String, primary_key=True)
+    category = Column(String, primary_key=True)
+    orders_placed = Column(Integer, nullable=False, default=0)
+    orders_picked_up = Column(Integer, nullable=False, default=0)
+    orders_cancelled = Column(Integer, nullable=False, default=0)
+
+# Do'kon reytingi xulosasi: har bir yangi sharhda yangilanadi
+class ShopRating(Base):
+    __tablename__ = "shop_ratings"
+    shop_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    sum = Column(Integer, nullable=False, default=0)
+    r1 = Column(Integer, nullable=False, default=0)
+    r2 = Column(Integer, nullable=False, default=0)
+    r3 = Column(Integer, nullable=False, default=0)
+    r4 = Column(Integer, nullable=False, default=0)
+    r5 = Column(Integer, nullable=False, default=0)
+
+_UPSERT_DIALECTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+def increment(db, model, keys: dict, deltas: dict):
+    """Adds deltas to the row identified by keys, creating it if needed (upsert)."""
+    dialect_insert = _UPSERT_DIALECTS.get(db.get_bind().dialect.name)
+    if dialect_insert is not None:
+        stmt = dialect_insert(model).values(**keys, **deltas)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={name: getattr(model, name) + stmt.excluded[name] for name in deltas},
+        )
+        db.execute(stmt)
+        return
+    conditions = [getattr(model, name) == value for name, value in keys.items()]
+    result = db.execute(update(model).where(*conditions)
+                        .values({name: getattr(model, name) + delta for name, delta in deltas.items()}))
+    if result.rowcount == 0:
+        db.execute(insert(model).values(**keys, **deltas))
+
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+    version = Column(Integer, primary_key=True)
+    applied_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+# Migratsiyalar: (versiya, funksiya). Har biri bir marta, tartib bilan bajariladi.
+def _create_indexes(db):
+    inspector = inspect(db.connection())
+    for model in (User, Bag, Order, Review):
+        existing = {column["name"] for column in inspector.get_columns(model.__tablename__)}
+        for index in model.__table__.indexes:
+            # Ustuni hali qo'shilmagan indeks o'sha ustunni qo'shadigan migratsiyada yaratiladi
+            if all(column.name in existing for column in index.columns):
+                index.create(bind=db.connection(), checkfirst=True)
+
+def _add_columns(db, model, *columns):
+    connection = db.connection()
+    existing = {column["name"] for column in inspect(connection).get_columns(model.__tablename__)}
+    for column in columns:
+        if column.name not in existing:
+            connection.execute(text(f"ALTER TABLE {model.__tablename__} ADD COLUMN {column.name} "
+                                    f"{column.type.compile(dialect=connection.dialect)}"))
+
+def _add_pickup_datetimes(db):
+    from pickup import pickup_columns
+    _add_columns(db, Bag, Bag.pickup_start_at, Bag.pickup_end_at)
+    # Eski satrlar imkon qadar o'qiladi; tushunarsiz matn NULL bo'lib qoladi (muddati o'tmaydi)
+    rows = db.query(Bag.id, Bag.pickup_start, Bag.pickup_end).filter(Bag.pickup_end_at.is_(None)).all()
+    updates = [{"id": row.id, **pickup_columns(row.pickup_start, row.pickup_end)} for row in rows]
+    updates = [values for values in updates if values["pickup_start_at"] or values["pickup_end_at"]]
+    for i in range(0, len(updates), 1000):
+        db.execute(update(Bag), updates[i:i + 1000])
+    _create_indexes(db)
+
+def _add_created_at(db):
+    # Eski satrlarning yaratilgan vaqti noma'lum: NULL qoladi, sana filtrlari ularni o'tkazib yuboradi
+    for model in (User, Bag, Order, Review):
+        _add_columns(db, model, model.created_at)
+
+def _seed_stat_counters(db):
+    # Hisoblagichlar birinchi marta mavjud buyurtmalar tarixidan to'ldiriladi
+    if db.query(StatCounter).first():
+        return
+    statuses = dict(db.query(Order.status, func.count(Order.id)).group_by(Order.status).all())
+    db.add_all([
+        StatCounter(name="orders_placed", value=sum(statuses.values())),
+        StatCounter(name="orders_picked_up", value=statuses.get("picked_up", 0)),
+        StatCounter(name="orders_cancelled", value=statuses.get("cancelled", 0)),
+    ])
+
+def _backfill_shop_ratings(db):
+    if db.query(ShopRating).first():
+        return
+    summaries = {}
+    for shop_id, rating, n in db.query(Review.shop_id, Review.rating, func.count(Review.id)).group_by(Review.shop_id, Review.rating):
+        summary = summaries.setdefault(shop_id, ShopRating(shop_id=shop_id, count=0, sum=0, r1=0, r2=0, r3=0, r4=0, r5=0))
+        summary.count += n
+        summary.sum += rating * n
+        if 1 <= rating <= 5:
+            setattr(summary, f"r{rating}", getattr(summary, f"r{rating}") + n)
+    db.add_all(summaries.values())
+
+MIGRATIONS = [
+    (1, _seed_stat_counters),
+    (2, _backfill_shop_ratings),
+    (3, _create_indexes),
+    (4, _add_pickup_datetimes),
+    (5, _add_created_at),
+    (6, _create_indexes),
+]
+
+def migrate(db):
+    applied = {version for (version,) in db.query(SchemaVersion.version)}
+    for version, step in MIGRATIONS:
+        if version not in applied:
+            step(db)
+            db.add(SchemaVersion(version=version))
+            db.commit()
 
 def init_db():
     Base.metadata.create_all(bind=engine)
     with SessionLocal() as db:
+        migrate(db)
         # Sample data
         if not db.query(User).filter_by(email="admin@example.com").first():
             admin = User(
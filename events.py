@@ -0,0 +1,123 @@
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from geo import haversine, KM_PER_DEG_LAT
+
+EVENT_HISTORY_SIZE = int(os.getenv("EVENT_HISTORY_SIZE", "5000"))
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("SUBSCRIBER_QUEUE_SIZE", "256"))
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+# /bags javobida: ro'yxat qaysi hodisagacha yangi ekani (oqimni shu joydan davom ettirish uchun)
+LAST_EVENT_ID_HEADER = "X-Last-Event-Id"
+
+class Subscription:
+    def __init__(self, loop: asyncio.AbstractEventLoop, category: Optional[str] = None,
+                 lat: Optional[float] = None, lon: Optional[float] = None, radius: Optional[float] = None):
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.category = category
+        self.origin = (lat, lon) if lat is not None and lon is not None and radius else None
+        self.radius = radius
+        self.backlog: List[Dict] = []
+        self.overflowed = False
+
+    def matches(self, event: Dict) -> bool:
+        if self.category and event.get("category") != self.category:
+            return False
+        if self.origin:
+            lat, lon = event.get("lat"), event.get("lon")
+            if lat is None or lon is None:
+                return False
+            # Arzon bounding-box tekshiruvi, keyin aniq masofa
+            if abs(lat - self.origin[0]) * KM_PER_DEG_LAT > self.radius:
+                return False
+            if haversine(self.origin[0], self.origin[1], lat, lon) > self.radius:
+                return False
+        return True
+
+    def _put(self, event: Dict):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Sekin mijoz: hodisalar tashlanadi, mijozga ro'yxatni qayta yuklash aytiladi
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": "reset"})
+
+class BagEventHub:
+    """In-process fan-out of bag changes to server-sent event subscribers.
+
+    publish() is thread-safe and is called from the (threadpool) endpoints;
+    delivery to each subscriber's asyncio queue is scheduled on its loop.
+    Recent events are kept in a ring buffer so clients can resume with
+    Last-Event-ID after a reconnect.
+    """
+
+    def __init__(self, history_size: int = EVENT_HISTORY_SIZE):
+        # Epoch qayta ishga tushgandan keyingi eski id'larni ajratib turadi
+        self.epoch = format(int(time.time()), "x")
+        self._counter = itertools.count(1)
+        self._history: deque = deque(maxlen=history_size)
+        self._subscribers: set = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    @property
+    def last_id(self) -> str:
+        """Id of the newest event; a client that read data now resumes the stream from here."""
+        with self._lock:
+            return self._history[-1]["id"] if self._history else f"{self.epoch}-0"
+
+    def publish(self, event_type: str, bag: Dict):
+        with self._lock:
+            event = {"id": f"{self.epoch}-{next(self._counter)}", "type": event_type, **bag}
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            if sub.matches(event):
+                sub.loop.call_soon_threadsafe(sub._put, event)
+
+    def subscribe(self, category: Optional[str] = None, lat: Optional[float] = None, lon: Optional[float] = None,
+                  radius: Optional[float] = None, last_event_id: Optional[str] = None) -> Subscription:
+        sub = Subscription(asyncio.get_running_loop(), category, lat, lon, radius)
+        with self._lock:
+            if last_event_id:
+                sub.backlog = self._replay(sub, last_event_id)
+            self._subscribers.add(sub)
+        return sub
+
+    def _replay(self, sub: Subscription, last_event_id: str) -> List[Dict]:
+        epoch, _, seq = last_event_id.partition("-")
+        oldest = self._history[0]["id"] if self._history else None
+        if epoch != self.epoch or not seq.isdigit():
+            return [{"type": "reset"}]
+        seq = int(seq)
+        if oldest is not None and seq < int(oldest.partition("-")[2]) - 1:
+            # Bufer allaqachon aylanib ketgan — to'liq qayta yuklash kerak
+            return [{"type": "reset"}]
+        return [event for event in self._history
+                if int(event["id"].partition("-")[2]) > seq and sub.matches(event)]
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+def format_sse(event: Dict) -> str:
+    lines = []
+    if "id" in event:
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event['type']}")
+    lines.append(f"data: {json.dumps(event, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+bag_events = BagEventHub()
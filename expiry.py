@@ -0,0 +1,138 @@
+import heapq
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from database import Bag
+from pickup import utcnow
+
+logger = logging.getLogger("surplussaver.expiry")
+
+EXPIRY_BATCH_SIZE = int(os.getenv("EXPIRY_BATCH_SIZE", "500"))
+# Navbatdagi muddat uzoq bo'lsa ham oqim shuncha soniyadan ortiq uxlamaydi
+EXPIRY_MAX_SLEEP_SECONDS = float(os.getenv("EXPIRY_MAX_SLEEP_SECONDS", "60"))
+
+class ExpiryScheduler:
+    """Flips available bags to "expired" when their pickup window ends.
+
+    Upcoming deadlines live in a min-heap, so the worker thread sleeps until
+    the earliest one and then expires exactly the due bags in one conditional
+    UPDATE per batch; it never scans the bags table. Rescheduling a bag just
+    pushes a new entry: stale heap entries are skipped when popped.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], batch_size: int = EXPIRY_BATCH_SIZE,
+                 on_expired: Optional[Callable[[Session, List[str]], None]] = None):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.on_expired = on_expired
+        self._heap: List[Tuple[datetime, str]] = []
+        self._deadlines: Dict[str, datetime] = {}
+        self._wakeup = threading.Condition()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        self.metrics = {"scheduled": 0, "expired": 0, "batches": 0, "failed": 0}
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def load(self, db: Session):
+        """Schedules every available bag with a known pickup end (run once at startup)."""
+        rows = (db.query(Bag.id, Bag.pickup_end_at)
+                .filter(Bag.status == "available", Bag.pickup_end_at.isnot(None)))
+        with self._wakeup:
+            for bag_id, end_at in rows:
+                self._deadlines[bag_id] = end_at
+                self._heap.append((end_at, bag_id))
+            heapq.heapify(self._heap)
+            self._start()
+            self._wakeup.notify()
+
+    def schedule(self, bag_id: str, end_at: Optional[datetime]):
+        if end_at is None:
+            self.cancel(bag_id)
+            return
+        with self._wakeup:
+            if self._deadlines.get(bag_id) == end_at:
+                return
+            self._deadlines[bag_id] = end_at
+            heapq.heappush(self._heap, (end_at, bag_id))
+            self.metrics["scheduled"] += 1
+            # Eski yozuvlar ko'payib ketsa, uyum qayta quriladi
+            if len(self._heap) > 2 * len(self._deadlines) + 1024:
+                self._heap = [(deadline, key) for key, deadline in self._deadlines.items()]
+                heapq.heapify(self._heap)
+            self._start()
+            if self._heap[0][1] == bag_id:
+                self._wakeup.notify()
+
+    def cancel(self, bag_id: str):
+        with self._wakeup:
+            self._deadlines.pop(bag_id, None)
+
+    def stats(self) -> Dict:
+        with self._wakeup:
+            next_due = self._heap[0][0].isoformat() if self._heap else None
+            return {"scheduled_bags": len(self._deadlines), "heap_size": len(self._heap),
+                    "next_due": next_due, **self.metrics}
+
+    def shutdown(self):
+        with self._wakeup:
+            self._stopped = True
+            self._wakeup.notify()
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="bag-expiry", daemon=True)
+            self._thread.start()
+
+    def _due(self, now: datetime) -> List[str]:
+        due = []
+        while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+            deadline, bag_id = heapq.heappop(self._heap)
+            if self._deadlines.get(bag_id) == deadline:
+                del self._deadlines[bag_id]
+                due.append(bag_id)
+        return due
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                while not self._stopped:
+                    now = utcnow()
+                    due = self._due(now)
+                    if due:
+                        break
+                    timeout = EXPIRY_MAX_SLEEP_SECONDS
+                    if self._heap:
+                        timeout = min(timeout, max(0.0, (self._heap[0][0] - now).total_seconds()))
+                    self._wakeup.wait(timeout)
+                if self._stopped:
+                    return
+            self._expire(due, now)
+
+    def _expire(self, bag_ids: List[str], now: datetime):
+        try:
+            with self.session_factory() as db:
+                # Shart qayta tekshiriladi: bu orada sotilgan yoki oynasi uzaytirilgan sumkalar tegilmaydi
+                db.execute(
+                    update(Bag)
+                    .where(Bag.id.in_(bag_ids), Bag.status == "available", Bag.pickup_end_at <= now)
+                    .values(status="expired")
+                    .execution_options(synchronize_session=False)
+                )
+                db.commit()
+                expired = [bag_id for (bag_id,) in
+                           db.query(Bag.id).filter(Bag.id.in_(bag_ids), Bag.status == "expired")]
+                self.metrics["batches"] += 1
+                self.metrics["expired"] += len(expired)
+                if expired and self.on_expired is not None:
+                    self.on_expired(db, expired)
+        except Exception:
+            logger.exception("Failed to expire %d bags", len(bag_ids))
+            self.metrics["failed"] += len(bag_ids)
@@ -0,0 +1,96 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from typing import Iterator, Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import Select, select
+
+from database import SessionLocal, User, Bag, Order, Review
+
+# Bir partiyada bazadan olinadigan va bitta bo'lak qilib yuboriladigan satrlar soni
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# Faqat ustunlar tanlanadi (ORM obyektlari yaratilmaydi); parol xeshi hech qachon eksport qilinmaydi
+EXPORTS = {
+    "users": (User, ("id", "name", "email", "role", "lat", "lon", "approved", "created_at")),
+    "bags": (Bag, ("id", "shop_id", "description", "price", "quantity", "pickup_start", "pickup_end",
+                   "pickup_start_at", "pickup_end_at", "category", "status", "created_at")),
+    "orders": (Order, ("id", "customer_id", "bag_id", "status", "created_at")),
+    "reviews": (Review, ("id", "customer_id", "shop_id", "rating", "comment", "created_at")),
+}
+
+def build_query(table: str, role: Optional[str] = None, status: Optional[str] = None,
+                start: Optional[datetime] = None, end: Optional[datetime] = None,
+                columns: Optional[Sequence[str]] = None) -> Select:
+    """Column-only select for an export with every filter applied in SQL."""
+    model, exported = EXPORTS[table]
+    columns = columns or exported
+    query = select(*(getattr(model, name) for name in columns))
+    if role is not None:
+        if not hasattr(model, "role"):
+            raise HTTPException(status_code=400, detail=f"{table} can't be filtered by role")
+        query = query.where(model.role == role)
+    if status is not None:
+        if not hasattr(model, "status"):
+            raise HTTPException(status_code=400, detail=f"{table} can't be filtered by status")
+        query = query.where(model.status == status)
+    if start is not None:
+        query = query.where(model.created_at >= start)
+    if end is not None:
+        query = query.where(model.created_at < end)
+    # yield_per server tomonidagi kursorni yoqadi (PostgreSQL); SQLite kursori baribir dangasa o'qiydi
+    return query.order_by(model.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+def _iso(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Unserializable {type(value).__name__}")
+
+def _json(columns, row) -> str:
+    return json.dumps(dict(zip(columns, row)), default=_iso, separators=(",", ":"))
+
+def _ndjson(columns, rows) -> str:
+    return "".join(_json(columns, row) + "\n" for row in rows)
+
+def _csv(columns, rows) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([value.isoformat() if isinstance(value, datetime) else value for value in row]
+                                 for row in rows)
+    return buffer.getvalue()
+
+def json_array(query: Select) -> Iterator[str]:
+    """Yields a JSON array of objects (one per row) from a column select, one partition at a time."""
+    columns = [column.key for column in query.selected_columns]
+
+    def generate():
+        with SessionLocal() as db:
+            separator = "["
+            for rows in db.execute(query).partitions():
+                if rows:
+                    yield separator + ",".join(_json(columns, row) for row in rows)
+                    separator = ","
+            yield "]" if separator == "," else "[]"
+    return generate()
+
+def stream(table: str, fmt: str, **filters) -> Iterator[str]:
+    """Yields the export in chunks of EXPORT_BATCH_SIZE rows.
+
+    The query is built before streaming starts, so bad filters still become
+    HTTP errors. The generator opens its own session because the request's
+    get_db session is closed before a streaming body is sent.
+    """
+    query = build_query(table, **filters)
+    columns = EXPORTS[table][1]
+    encode = _csv if fmt == "csv" else _ndjson
+
+    def generate():
+        with SessionLocal() as db:
+            if fmt == "csv":
+                yield _csv(columns, [columns])
+            for rows in db.execute(query).partitions():
+                yield encode(columns, rows)
+    return generate()
@@ -115,9 +115,19 @@ if (document.getElementById('available-bags')) {
     const customerOrders = document.getElementById('customer-orders');
     const user = await getCurrentUser();
 
+    let bags = [];
+    let lastEventId = null;
+    let bagStream = null;
+
     async function loadAvailableBags() {
         const response = await fetch(`${API_URL}/bags`);
-        const bags = await response.json();
+        bags = await response.json();
+        // Ro'yxat shu hodisagacha yangi: oqim shu id'dan davom ettiriladi
+        lastEventId = response.headers.get('X-Last-Event-Id');
+        renderAvailableBags();
+    }
+
+    function renderAvailableBags() {
         availableBags.innerHTML = bags.map(bag => `
             <div class="bag-item">
                 <p>${bag.description} - $${bag.discounted_price} (Original: $${bag.original_price})</p>
@@ -127,6 +137,36 @@ if (document.getElementById('available-bags')) {
         `).join('');
     }
 
+    // Ro'yxat bir marta yuklanadi, keyin server yuborgan o'zgarishlar qo'llanadi: sotuvdan chiqqan sumka
+    // olib tashlanadi, sotuvga chiqqan (yangi yoki qayta ochilgan) sumka qo'shiladi. Ro'yxat /bags'dagi
+    // barcha mavjud sumkalar, shuning uchun u shu to'plamdan oshib ketmaydi
+    const applyBagEvent = (event) => {
+        const data = JSON.parse(event.data);
+        const index = bags.findIndex(bag => bag.id === data.bag_id);
+        if (data.status !== 'available') {
+            if (index === -1) return;
+            bags.splice(index, 1);
+        } else {
+            const bag = { ...(index !== -1 ? bags[index] : {}), id: data.bag_id, shop_id: data.shop_id,
+                          description: data.description, price: data.price, quantity: data.quantity };
+            if (index !== -1) bags[index] = bag; else bags.push(bag);
+        }
+        renderAvailableBags();
+    };
+
+    // Oqim dastlabki yuklashdan keyin ochiladi va ro'yxat olingan joydan davom etadi,
+    // shuning uchun yuklash paytida kelgan hodisalar ham yo'qolmaydi
+    function openBagStream() {
+        if (bagStream) bagStream.close();
+        const resume = lastEventId ? `?last_event_id=${encodeURIComponent(lastEventId)}` : '';
+        bagStream = new EventSource(`${API_URL}/bags/stream${resume}`);
+        ['created', 'updated', 'sold', 'expired', 'deleted'].forEach(type => bagStream.addEventListener(type, applyBagEvent));
+        bagStream.addEventListener('reset', async () => {
+            await loadAvailableBags();
+            openBagStream();
+        });
+    }
+
     async function loadOrders() {
         const response = await fetch(`${API_URL}/customers/${user.id}/orders`, {
             headers: { 'Authorization': `Bearer ${localStorage.getItem('token')}` }
@@ -147,7 +187,6 @@ if (document.getElementById('available-bags')) {
         });
         if (response.ok) {
             alert('Bag purchased successfully!');
-            loadAvailableBags();
             loadOrders();
         } else {
             const data = await response.json();
@@ -169,7 +208,7 @@ if (document.getElementById('available-bags')) {
         }
     };
 
-    loadAvailableBags();
+    loadAvailableBags().then(openBagStream);
     loadOrders();
 }
 
@@ -0,0 +1,43 @@
+from math import radians, sin, cos, sqrt, atan2, asin
+from typing import List, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371
+KM_PER_DEG_LAT = 111.195
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    R = EARTH_RADIUS_KM
+    dlat, dlon = radians(lat2 - lat1), radians(lon2 - lon1)
+    a = sin(dlat/2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)**2
+    return 2 * R * atan2(sqrt(a), sqrt(1-a))
+
+def haversine_batch(lat: float, lon: float, points: List[Tuple[float, float]]) -> List[float]:
+    """Distances (km) from one origin to many points; origin terms are computed once."""
+    lat1, lon1 = radians(lat), radians(lon)
+    cos_lat1 = cos(lat1)
+    d = 2 * EARTH_RADIUS_KM
+    out = []
+    append = out.append
+    for plat, plon in points:
+        lat2 = radians(plat)
+        a = sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * cos(lat2) * sin((radians(plon) - lon1) / 2) ** 2
+        append(d * asin(min(1.0, sqrt(a))))
+    return out
+
+def bounding_box(lat: float, lon: float, radius_km: float) -> Tuple[float, float, Optional[Tuple[float, float]]]:
+    """(lat_min, lat_max, (lon_min, lon_max)) covering the radius; lon range is None near poles or the antimeridian."""
+    dlat = radius_km / KM_PER_DEG_LAT
+    cos_lat = cos(radians(min(89.9, abs(lat) + dlat)))
+    dlon = radius_km / (KM_PER_DEG_LAT * cos_lat) if cos_lat > 0 else 360
+    if dlon * 2 >= 360 or lon - dlon < -180 or lon + dlon > 180:
+        return lat - dlat, lat + dlat, None
+    return lat - dlat, lat + dlat, (lon - dlon, lon + dlon)
+
+def planar_distance_sq(lat_col, lon_col, lat: float, lon: float):
+    """Squared equirectangular distance (km^2) as plain arithmetic, so it can run in SQL.
+
+    Uses cos of the origin's latitude, which is within a fraction of a
+    percent of the haversine distance at city-scale radii.
+    """
+    dy = (lat_col - lat) * KM_PER_DEG_LAT
+    dx = (lon_col - lon) * (KM_PER_DEG_LAT * cos(radians(lat)))
+    return dy * dy + dx * dx
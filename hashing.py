@@ -0,0 +1,77 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+
+from database import pwd_context
+
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", str(os.cpu_count() or 1)))
+# Navbatda kutishi mumkin bo'lgan qo'shimcha vazifalar soni (ishlayotganlardan tashqari)
+HASH_QUEUE_SIZE = int(os.getenv("HASH_QUEUE_SIZE", str(HASH_POOL_WORKERS * 8)))
+HASH_RETRY_AFTER_SECONDS = int(os.getenv("HASH_RETRY_AFTER_SECONDS", "1"))
+
+# Jarayonlar hovuzida ishlaydigan funksiyalar modul darajasida bo'lishi kerak (pickle)
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+def _verify_and_update(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(password, hashed)
+
+class HashingPool:
+    """Bounded process pool for bcrypt work so it never runs on a request thread."""
+
+    def __init__(self, workers: int = HASH_POOL_WORKERS, queue_size: int = HASH_QUEUE_SIZE):
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        """Hashing jobs queued or running."""
+        return self._pending
+
+    def _acquire(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pending >= self.capacity:
+                raise HTTPException(status_code=503, detail="Server busy, try again later",
+                                    headers={"Retry-After": str(HASH_RETRY_AFTER_SECONDS)})
+            self._pending += 1
+            # Hovuz birinchi so'rovda yaratiladi, import paytida jarayonlar ochilmaydi
+            if self._executor is None:
+                # "spawn": bu paytda jarayonda oqimlar bor (expiry, notifier) — fork qulflarni nusxalab osilib qolishi mumkin
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    async def _run(self, fn, *args):
+        executor = self._acquire()
+        try:
+            return await asyncio.wrap_future(executor.submit(fn, *args))
+        finally:
+            self._release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """Returns (valid, new_hash); new_hash is set when the stored hash uses an outdated cost."""
+        return await self._run(_verify_and_update, password, hashed)
+
+    def shutdown(self):
+        """Stops the workers; waits for them so interpreter exit finds no half-closed pool."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+hashing_pool = HashingPool()
@@ -0,0 +1,67 @@
+from typing import List
+
+from sqlalchemy import update, case, and_
+from sqlalchemy.orm import Session
+
+from database import Bag, Order
+from pickup import utcnow
+import search
+
+# Zaxira atomik shartli UPDATE orqali olinadi: tekshirish va kamaytirish bitta
+# SQL buyrug'ida bajariladi, shuning uchun parallel xaridorlar ortiqcha sota olmaydi.
+# SET ichidagi ustunlar eski qiymatga ishora qiladi (SQLite, PostgreSQL).
+
+def reserve_bag(db: Session, bag_id: str) -> bool:
+    """Takes one unit of the bag; returns False if it is sold out or unavailable."""
+    result = db.execute(
+        update(Bag)
+        .where(Bag.id == bag_id, Bag.status == "available", Bag.quantity > 0)
+        .values(quantity=Bag.quantity - 1,
+                status=case((Bag.quantity == 1, "sold"), else_=Bag.status))
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+def release_bag(db: Session, bag_id: str) -> bool:
+    """Returns one unit to the bag, reopening it if it had sold out.
+
+    A sold-out bag whose pickup window has already ended becomes expired
+    instead: the expiry scheduler dropped it when it was sold. A reopened
+    bag goes back into the search index.
+    """
+    previous = db.query(Bag.status).filter(Bag.id == bag_id).scalar()
+    result = db.execute(
+        update(Bag)
+        .where(Bag.id == bag_id)
+        .values(quantity=Bag.quantity + 1,
+                status=case((and_(Bag.status == "sold", Bag.pickup_end_at <= utcnow()), "expired"),
+                            (Bag.status == "sold", "available"), else_=Bag.status))
+        .execution_options(synchronize_session=False)
+    )
+    # Indeks faqat holat "sold"dan o'zgarganda yangilanadi (mavjud sumkaga birlik qaytishi indeksga ta'sir qilmaydi)
+    if previous == "sold":
+        search.sync_bags(db, [bag_id])
+    return result.rowcount == 1
+
+def transition_order(db: Session, order_id: str, from_status: str, to_status: str) -> bool:
+    """Moves an order between statuses only if nobody else has moved it first."""
+    result = db.execute(
+        update(Order)
+        .where(Order.id == order_id, Order.status == from_status)
+        .values(status=to_status)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+def reopen_expired(db: Session, bag_ids: List[str]) -> int:
+    """Puts expired bags whose pickup window now ends in the future back on sale.
+
+    Callers re-sync the search index for these bags afterwards.
+    """
+    result = db.execute(
+        update(Bag)
+        .where(Bag.id.in_(bag_ids), Bag.status == "expired", Bag.quantity > 0, Bag.pickup_end_at > utcnow())
+        .values(status="available")
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
@@ -1,17 +1,34 @@
 import os
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional, List
-from math import radians, sin, cos, sqrt, atan2
+from typing import Optional, List, Tuple
+from sqlalchemy import func, select, tuple_, or_, and_
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import datetime, timedelta
 import uuid
+import asyncio
 
 from models import User, UserUpdate, Bag, Review
-from database import get_db, User as UserModel, Bag as BagModel, Order as OrderModel, Review as ReviewModel, init_db, pwd_context
-from auth import get_current_user, check_role, create_access_token, create_refresh_token
-from tasks import send_notification
+from database import get_db, engine, SessionLocal, User as UserModel, Bag as BagModel, Order as OrderModel, Review as ReviewModel, ShopRating, init_db
+from auth import get_current_user, check_role, create_access_token, create_refresh_token, invalidate_user, auth_cache_stats
+from notifications import notifier
+from response_cache import response_cache
+from events import bag_events, format_sse, STREAM_HEARTBEAT_SECONDS, LAST_EVENT_ID_HEADER
+from hashing import hashing_pool
+from geo import haversine_batch, bounding_box, planar_distance_sq
+from inventory import reserve_bag, release_bag, reopen_expired, transition_order
+from pickup import pickup_columns, pickup_window, utcnow
+from expiry import ExpiryScheduler
+import stats
+import bulk
+import ratings
+import exports
+import search
+from pagination import page_size, fetch_size, decode_cursor, set_next_cursor, NEXT_CURSOR_HEADER
+from metrics import MetricsMiddleware, instrument_engine, registry, gauge
 
 app = FastAPI(title="SurplusSaver API")
 
@@ -22,38 +39,131 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, LAST_EVENT_ID_HEADER, "ETag"],
 )
+# Har bir so'rov uchun kechikish va SQL hisobi (/metrics)
+app.add_middleware(MetricsMiddleware)
+instrument_engine(engine)
 
 init_db()
 
-def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    R = 6371  # Earth radius in km
-    dlat, dlon = radians(lat2 - lat1), radians(lon2 - lon1)
-    a = sin(dlat/2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)**2
-    return 2 * R * atan2(sqrt(a), sqrt(1-a))
+with SessionLocal() as _db:
+    # Qidiruv indeksi yo'q bo'lsa (yangi baza yoki backend almashgan) bags jadvalidan quriladi
+    search.ensure_index(_db)
+
+# Keyset kalitlari: har bir saralash uchun barqaror tartib (oxirida id)
+BROWSE_SORT_KEYS = {
+    "id": lambda x: [x["id"]],
+    "price": lambda x: [x["price"], x["id"]],
+    "rating": lambda x: [x["rating"] or 0, x["id"]],
+    "rank": lambda x: [x["rank"], x["id"]],
+}
+
+# Joylashuvi noma'lum do'konlar uchun saralash kaliti (km^2)
+UNKNOWN_DISTANCE_SQ = 1e18
+
+def _distances(lat: float, lon: float, rows) -> List[Optional[float]]:
+    located = [i for i, row in enumerate(rows) if row.lat is not None and row.lon is not None]
+    distances = [None] * len(rows)
+    for i, distance in zip(located, haversine_batch(lat, lon, [(rows[i].lat, rows[i].lon) for i in located])):
+        distances[i] = distance
+    return distances
+
+def publish_bag(event_type: str, bag_id: str, shop_id: str, description: str, price: float, quantity: int,
+                category: str, status: str, previous_category: Optional[str] = None,
+                location: Tuple[Optional[float], Optional[float]] = (None, None)):
+    """Invalidates cached listings for the bag and pushes the change to stream subscribers.
+
+    location is the shop's (lat, lon), used by subscribers filtering on a radius.
+    """
+    response_cache.versions.bump(("bags",), ("bag", bag_id), ("shop", shop_id), ("category", category))
+    if previous_category and previous_category != category:
+        response_cache.versions.bump(("category", previous_category))
+    lat, lon = location
+    bag_events.publish(event_type, {"bag_id": bag_id, "shop_id": shop_id, "description": description, "price": price,
+                                    "quantity": quantity, "category": category, "status": status, "lat": lat, "lon": lon})
+
+def publish_bag_state(db: Session, bag_id: str):
+    """Publishes the committed state of a bag whose stock just changed."""
+    publish_bag_states(db, [bag_id])
+
+def publish_bag_states(db: Session, bag_ids: List[str]):
+    bags = (db.query(BagModel.id, BagModel.shop_id, BagModel.description, BagModel.price, BagModel.quantity,
+                     BagModel.category, BagModel.status, UserModel.lat, UserModel.lon)
+            .outerjoin(UserModel, UserModel.id == BagModel.shop_id).filter(BagModel.id.in_(bag_ids)).all())
+    # Sotib bo'lingan va muddati o'tgan sumkalar qidiruv indeksidan chiqariladi
+    gone = [bag.id for bag in bags if bag.status in ("sold", "expired")]
+    if gone:
+        search.remove_bags(db, gone)
+        db.commit()
+    for bag in bags:
+        publish_bag(bag.status if bag.status in ("sold", "expired") else "updated", bag.id, bag.shop_id,
+                    bag.description, bag.price, bag.quantity, bag.category, bag.status, location=(bag.lat, bag.lon))
+
+def _shop_location(db: Session, shop_id: str) -> Tuple[Optional[float], Optional[float]]:
+    shop = db.query(UserModel.lat, UserModel.lon).filter_by(id=shop_id).first()
+    return (shop.lat, shop.lon) if shop else (None, None)
+
+def _bag_keys(db: Session, bag_id: str) -> Tuple[Optional[str], Optional[str]]:
+    """(shop_id, category) for stats; (None, None) if the shop has since deleted the bag."""
+    bag = db.query(BagModel.shop_id, BagModel.category).filter_by(id=bag_id).first()
+    return (bag.shop_id, bag.category) if bag else (None, None)
+
+# Pickup oynasi tugagan sumkalar fon oqimida "expired" holatiga o'tkaziladi
+expiry_scheduler = ExpiryScheduler(SessionLocal, on_expired=publish_bag_states)
+with SessionLocal() as _db:
+    expiry_scheduler.load(_db)
+
+@app.on_event("shutdown")
+def shutdown():
+    hashing_pool.shutdown()
+    notifier.shutdown()
+    expiry_scheduler.shutdown()
 
 @app.get("/")
 def root():
     return {"message": "Welcome to SurplusSaver API! Visit /docs for API documentation."}
 
 # User-related endpoints
-@app.post("/users/register")
-def register(user: User, db: Session = Depends(get_db)):
-    if db.query(UserModel).filter_by(email=user.email).first():
-        raise HTTPException(status_code=400, detail="Email already registered")
-    hashed_password = pwd_context.hash(user.password)
-    db_user = UserModel(name=user.name, email=user.email, password=hashed_password, role=user.role, lat=user.lat, lon=user.lon)
+# Bu endpointlar async (bcrypt hovuzini kutadi), shuning uchun sinxron SQL ishi threadpool'da
+# bajariladi: SQLite yozish qulfini kutish event loop'ni (va SSE mijozlarini) to'xtatmasligi kerak
+def _email_taken(db: Session, email: str) -> bool:
+    return db.query(UserModel.id).filter_by(email=email).first() is not None
+
+def _add_user(db: Session, db_user: UserModel) -> str:
     db.add(db_user)
     db.commit()
-    return {"id": db_user.id}
+    return db_user.id
+
+def _find_login(db: Session, email: str):
+    return db.query(UserModel.id, UserModel.password).filter_by(email=email).first()
+
+def _set_password(db: Session, user_id: str, hashed_password: str):
+    db.query(UserModel).filter_by(id=user_id).update({"password": hashed_password}, synchronize_session=False)
+    db.commit()
+
+@app.post("/users/register")
+async def register(user: User, db: Session = Depends(get_db)):
+    if await run_in_threadpool(_email_taken, db, user.email):
+        raise HTTPException(status_code=400, detail="Email already registered")
+    hashed_password = await hashing_pool.hash(user.password)
+    db_user = UserModel(id=str(uuid.uuid4()), name=user.name, email=user.email, password=hashed_password,
+                        role=user.role, lat=user.lat, lon=user.lon)
+    return {"id": await run_in_threadpool(_add_user, db, db_user)}
 
 @app.post("/users/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(UserModel).filter_by(email=form_data.username).first()
-    if not user or not pwd_context.verify(form_data.password, user.password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    user = await run_in_threadpool(_find_login, db, form_data.username)
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    access_token = create_access_token({"sub": user.id})
-    refresh_token = create_refresh_token({"sub": user.id})
+    valid, new_hash = await hashing_pool.verify_and_update(form_data.password, user.password)
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    user_id = user.id
+    if new_hash:
+        await run_in_threadpool(_set_password, db, user_id, new_hash)
+    access_token = create_access_token({"sub": user_id})
+    refresh_token = create_refresh_token({"sub": user_id})
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
 @app.get("/users/me")
@@ -69,23 +179,32 @@ def get_user(current_user: dict = Depends(get_current_user), db: Session = Depen
         "approved": user.approved
     }
 
-@app.patch("/users/me")
-def update_user(update: UserUpdate, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    user = db.query(UserModel).filter_by(id=current_user["id"]).first()
+def _update_profile(db: Session, user_id: str, update: UserUpdate, hashed_password: Optional[str]) -> dict:
+    user = db.query(UserModel).filter_by(id=user_id).first()
     if update.name:
         user.name = update.name
-    if update.password:
-        user.password = pwd_context.hash(update.password)
+    if hashed_password:
+        user.password = hashed_password
     if update.lat is not None:
         user.lat = update.lat
     if update.lon is not None:
         user.lon = update.lon
     db.commit()
+    return {"id": user.id, "role": user.role, "lat": user.lat, "lon": user.lon}
+
+@app.patch("/users/me")
+async def update_user(update: UserUpdate, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+    # Xesh DB tranzaksiyasidan oldin hisoblanadi: qator bcrypt kutilayotganda qulflanmaydi
+    hashed_password = await hashing_pool.hash(update.password) if update.password else None
+    user = await run_in_threadpool(_update_profile, db, current_user["id"], update, hashed_password)
+    invalidate_user(user["id"])
+    if user["role"] == "shop" and (update.lat is not None or update.lon is not None):
+        response_cache.versions.bump(("shops",))
     return {"message": "Profile updated"}
 
 @app.post("/users/notifications/subscribe")
 def subscribe_notifications(device_token: str, current_user: dict = Depends(get_current_user)):
-    send_notification.delay(current_user["id"], "Subscribed to notifications")
+    notifier.notify(current_user["id"], "Subscribed to notifications")
     return {"message": "Subscribed"}
 
 # Shop-related endpoints
@@ -93,18 +212,62 @@ def subscribe_notifications(device_token: str, current_user: dict = Depends(get_
 def create_bag(shop_id: str, bag: Bag, current_user: dict = Depends(check_role(["shop"])), db: Session = Depends(get_db)):
     if current_user["id"] != shop_id:
         raise HTTPException(status_code=403, detail="Not your shop")
-    db_bag = BagModel(shop_id=shop_id, **bag.dict())
+    bag_id = str(uuid.uuid4())
+    window = pickup_columns(bag.pickup_start, bag.pickup_end)
+    db_bag = BagModel(id=bag_id, shop_id=shop_id, **bag.dict(), **window)
     db.add(db_bag)
+    search.index_bags(db, [{"id": bag_id, "description": bag.description, "category": bag.category}], replace=False)
     db.commit()
-    return {"id": db_bag.id}
+    expiry_scheduler.schedule(bag_id, window["pickup_end_at"])
+    publish_bag("created", bag_id, shop_id, bag.description, bag.price, bag.quantity, bag.category, "available",
+                location=_shop_location(db, shop_id))
+    return {"id": bag_id}
+
+@app.post("/shops/{shop_id}/bags:batch")
+async def batch_bags(shop_id: str, request: Request, current_user: dict = Depends(check_role(["shop"])),
+                     db: Session = Depends(get_db)):
+    """Creates (rows without id) or updates (rows with id) many bags at once.
+
+    Accepts a JSON array, or streams application/x-ndjson or text/csv bodies;
+    rows are validated and written in chunks of BULK_CHUNK_SIZE.
+    """
+    if current_user["id"] != shop_id:
+        raise HTTPException(status_code=403, detail="Not your shop")
+    results = []
+    async for chunk in bulk.iter_chunks(request):
+        results.extend(await run_in_threadpool(_apply_bag_chunk, db, shop_id, chunk))
+    counts = {"created": 0, "updated": 0, "error": 0}
+    for result in results:
+        counts[result["status"]] += 1
+    return {"created": counts["created"], "updated": counts["updated"], "failed": counts["error"], "results": results}
+
+def _apply_bag_chunk(db: Session, shop_id: str, chunk) -> list:
+    results, changes = bulk.apply_chunk(db, shop_id, chunk)
+    location = _shop_location(db, shop_id) if changes else (None, None)
+    for change in changes:
+        if change["status"] == "available":
+            expiry_scheduler.schedule(change["id"], change["pickup_end_at"])
+        publish_bag(change["event"], change["id"], shop_id, change["description"], change["price"], change["quantity"],
+                    change["category"], change["status"], change["previous_category"], location)
+    return results
 
 @app.get("/shops/{shop_id}/bags")
-def get_shop_bags(shop_id: str, status: Optional[str] = None, db: Session = Depends(get_db)):
-    query = db.query(BagModel).filter(BagModel.shop_id == shop_id)
-    if status:
-        query = query.filter(BagModel.status == status)
-    bags = query.all()
-    return [{"id": b.id, "description": b.description, "price": b.price, "quantity": b.quantity, "status": b.status} for b in bags]
+def get_shop_bags(shop_id: str, request: Request, status: Optional[str] = None, limit: Optional[int] = None,
+                  cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    limit = page_size(limit, cursor)
+    after = decode_cursor(cursor, "id")
+
+    def build(response: Response):
+        query = (db.query(BagModel.id, BagModel.description, BagModel.price, BagModel.quantity, BagModel.status)
+                 .filter(BagModel.shop_id == shop_id))
+        if status:
+            query = query.filter(BagModel.status == status)
+        if after:
+            query = query.filter(BagModel.id > after[0])
+        bags = query.order_by(BagModel.id).limit(fetch_size(limit)).all()
+        result = [{"id": b.id, "description": b.description, "price": b.price, "quantity": b.quantity, "status": b.status} for b in bags]
+        return set_next_cursor(response, result, limit, "id", lambda x: [x["id"]])
+    return response_cache.serve(request, [("shop", shop_id)], build)
 
 @app.patch("/shops/{shop_id}/bags/{bag_id}")
 def update_bag(shop_id: str, bag_id: str, bag: Bag, current_user: dict = Depends(check_role(["shop"])), db: Session = Depends(get_db)):
@@ -113,113 +276,275 @@ def update_bag(shop_id: str, bag_id: str, bag: Bag, current_user: dict = Depends
     db_bag = db.query(BagModel).filter_by(id=bag_id, shop_id=shop_id).first()
     if not db_bag:
         raise HTTPException(status_code=404, detail="Bag not found")
+    previous_category = db_bag.category
     db_bag.description = bag.description
     db_bag.price = bag.price
     db_bag.quantity = bag.quantity
     db_bag.pickup_start = bag.pickup_start
     db_bag.pickup_end = bag.pickup_end
+    db_bag.pickup_start_at, db_bag.pickup_end_at = pickup_window(bag.pickup_start, bag.pickup_end)
     db_bag.category = bag.category
+    bag_status = db_bag.status
+    db.flush()
+    # Oynasi kelajakka surilgan muddati o'tgan sumka qayta sotuvga chiqadi
+    if bag_status == "expired" and reopen_expired(db, [bag_id]):
+        bag_status = "available"
+    search.sync_bags(db, [bag_id])
     db.commit()
+    if bag_status == "available":
+        expiry_scheduler.schedule(bag_id, db_bag.pickup_end_at)
+    publish_bag("updated", bag_id, shop_id, bag.description, bag.price, bag.quantity, bag.category, bag_status,
+                previous_category, _shop_location(db, shop_id))
     return {"message": "Bag updated"}
 
 @app.delete("/shops/{shop_id}/bags/{bag_id}")
 def delete_bag(shop_id: str, bag_id: str, current_user: dict = Depends(check_role(["shop"])), db: Session = Depends(get_db)):
     if current_user["id"] != shop_id:
         raise HTTPException(status_code=403, detail="Not your shop")
-    db_bag = db.query(BagModel).filter_by(id=bag_id, shop_id=shop_id, status="available").first()
+    db_bag = (db.query(BagModel).filter(BagModel.id == bag_id, BagModel.shop_id == shop_id,
+                                        BagModel.status.in_(("available", "expired"))).first())
     if not db_bag:
         raise HTTPException(status_code=404, detail="Bag not found or already sold")
+    payload = (db_bag.description, db_bag.price, db_bag.quantity, db_bag.category)
     db.delete(db_bag)
+    search.remove_bags(db, [bag_id])
     db.commit()
+    expiry_scheduler.cancel(bag_id)
+    publish_bag("deleted", bag_id, shop_id, *payload, "deleted", location=_shop_location(db, shop_id))
     return {"message": "Bag deleted"}
 
 @app.get("/shops/{shop_id}/reviews")
-def get_reviews(shop_id: str, db: Session = Depends(get_db)):
-    reviews = db.query(ReviewModel).filter_by(shop_id=shop_id).all()
-    return [{"id": r.id, "rating": r.rating, "comment": r.comment} for r in reviews]
+def get_reviews(shop_id: str, request: Request, limit: Optional[int] = None, cursor: Optional[str] = None,
+                db: Session = Depends(get_db)):
+    limit = page_size(limit, cursor)
+    after = decode_cursor(cursor, "id")
+
+    def build(response: Response):
+        query = db.query(ReviewModel.id, ReviewModel.rating, ReviewModel.comment).filter(ReviewModel.shop_id == shop_id)
+        if after:
+            query = query.filter(ReviewModel.id > after[0])
+        reviews = query.order_by(ReviewModel.id).limit(fetch_size(limit)).all()
+        result = [{"id": r.id, "rating": r.rating, "comment": r.comment} for r in reviews]
+        return set_next_cursor(response, result, limit, "id", lambda x: [x["id"]])
+    return response_cache.serve(request, [("reviews", shop_id)], build)
+
+@app.get("/shops/{shop_id}/rating")
+def get_rating(shop_id: str, request: Request, db: Session = Depends(get_db)):
+    return response_cache.serve(request, [("reviews", shop_id)], lambda response: ratings.summary(db, shop_id))
 
 # Bag-related endpoints
 @app.get("/bags")
-def browse_bags(lat: Optional[float] = None, lon: Optional[float] = None, radius: Optional[float] = None, 
-                category: Optional[str] = None, sort_by: Optional[str] = None, db: Session = Depends(get_db)):
-    query = db.query(BagModel).filter(BagModel.status == "available")
-    if category:
-        query = query.filter(BagModel.category == category)
-    bags = query.all()
-    
-    result = []
-    for bag in bags:
-        shop = db.query(UserModel).filter_by(id=bag.shop_id).first()
-        distance = haversine(lat, lon, shop.lat, shop.lon) if lat and lon else None
-        if radius and distance and distance > radius:
-            continue
-        result.append({"id": bag.id, "shop_id": bag.shop_id, "description": bag.description, 
-                       "price": bag.price, "quantity": bag.quantity, "distance": distance})
-    
-    if sort_by == "price":
-        result.sort(key=lambda x: x["price"])
-    elif sort_by == "distance" and lat and lon:
-        result.sort(key=lambda x: x["distance"])
-    
-    return result
+def browse_bags(request: Request, response: Response, lat: Optional[float] = None, lon: Optional[float] = None,
+                radius: Optional[float] = None, category: Optional[str] = None, q: Optional[str] = None,
+                sort_by: Optional[str] = None,
+                include_rating: bool = False, open_now: bool = False,
+                closing_within: Optional[int] = Query(None, ge=1, description="minutes"),
+                limit: Optional[int] = None, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    limit = page_size(limit, cursor)
+    has_origin = lat is not None and lon is not None
+    searching = bool(q and search.query_terms(q))
+    sort = sort_by if sort_by in ("price", "rating") or (sort_by == "distance" and has_origin) else "id"
+    # Qidiruvda standart tartib — moslik darajasi (BM25)
+    if searching and sort_by in (None, "rank"):
+        sort = "rank"
+    after = decode_cursor(cursor, sort)
+    include_rating = include_rating or sort == "rating"
+    now = utcnow()
+
+    def build(response: Response):
+        # Bitta JOIN so'rovi, faqat kerakli ustunlar
+        columns = [BagModel.id, BagModel.shop_id, BagModel.description, BagModel.price, BagModel.quantity,
+                   UserModel.lat, UserModel.lon]
+        if include_rating:
+            columns += [ratings.average_rating.label("rating"), ShopRating.count.label("rating_count")]
+        query = db.query(*columns).join(UserModel, UserModel.id == BagModel.shop_id)
+        if include_rating:
+            query = query.outerjoin(ShopRating, ShopRating.shop_id == BagModel.shop_id)
+        if searching:
+            matched = search.matches(db, q)
+            query = query.join(matched, matched.c.bag_id == BagModel.id).add_columns(matched.c.rank)
+        if has_origin:
+            distance_sq = planar_distance_sq(UserModel.lat, UserModel.lon, lat, lon)
+            # Joylashuvi yo'q do'konlar masofa bo'yicha oxirida
+            distance_key = func.coalesce(distance_sq, UNKNOWN_DISTANCE_SQ)
+            if sort == "distance":
+                query = query.add_columns(distance_key.label("distance_sq"))
+        query = query.filter(BagModel.status == "available")
+        if category:
+            query = query.filter(BagModel.category == category)
+        if open_now:
+            query = query.filter(BagModel.pickup_start_at <= now, BagModel.pickup_end_at > now)
+        if closing_within:
+            query = query.filter(BagModel.pickup_end_at > now,
+                                 BagModel.pickup_end_at <= now + timedelta(minutes=closing_within))
+        if has_origin and radius:
+            # Radius SQLda: bounding box ichidagi do'konlar ix_users_lat_lon orqali topiladi, ularning
+            # sumkalari ix_bags_shop_status orqali. Aniq haversine chegarasi quyida, LIMIT'dan keyin
+            lat_min, lat_max, lon_range = bounding_box(lat, lon, radius)
+            nearby = select(UserModel.id).where(UserModel.lat.between(lat_min, lat_max))
+            if lon_range:
+                nearby = nearby.where(UserModel.lon.between(*lon_range))
+            query = query.filter(BagModel.shop_id.in_(nearby), distance_sq <= radius * radius * 1.01)
+
+        if sort == "price":
+            if after:
+                query = query.filter(tuple_(BagModel.price, BagModel.id) > tuple(after))
+            query = query.order_by(BagModel.price, BagModel.id)
+        elif sort == "rating":
+            if after:
+                query = query.filter(or_(ratings.average_rating < after[0],
+                                         and_(ratings.average_rating == after[0], BagModel.id > after[1])))
+            query = query.order_by(ratings.average_rating.desc(), BagModel.id)
+        elif sort == "rank":
+            if after:
+                query = query.filter(or_(matched.c.rank < after[0],
+                                         and_(matched.c.rank == after[0], BagModel.id > after[1])))
+            query = query.order_by(matched.c.rank.desc(), BagModel.id)
+        elif sort == "distance":
+            # Tartib tekis masofa bo'yicha (indeks ishlamaydi, lekin LIMIT bilan top-N saralash)
+            if after:
+                query = query.filter(or_(distance_key > after[0],
+                                         and_(distance_key == after[0], BagModel.id > after[1])))
+            query = query.order_by(distance_key, BagModel.id)
+        else:
+            if after:
+                query = query.filter(BagModel.id > after[0])
+            query = query.order_by(BagModel.id)
+        rows = query.limit(fetch_size(limit)).all()
+
+        distances = _distances(lat, lon, rows) if has_origin else [None] * len(rows)
+        result = [{"id": row.id, "shop_id": row.shop_id, "description": row.description,
+                   "price": row.price, "quantity": row.quantity, "distance": distance}
+                  for row, distance in zip(rows, distances)]
+        if include_rating:
+            for item, row in zip(result, rows):
+                item["rating"] = row.rating if row.rating_count else None
+                item["rating_count"] = row.rating_count or 0
+        if searching:
+            for item, row in zip(result, rows):
+                item["rank"] = row.rank
+        key = BROWSE_SORT_KEYS.get(sort)
+        if sort == "distance":
+            # Kursor SQLdagi saralash kaliti (tekis masofa), javobdagi aniq haversine emas
+            keys = {row.id: row.distance_sq for row in rows}
+            key = lambda item: [keys[item["id"]], item["id"]]
+        # Kursor oxirgi o'qilgan qatordan olinadi, shuning uchun chegaradan tashqaridagilarni
+        # tashlab yuborish sahifalashni buzmaydi
+        page = set_next_cursor(response, result, limit, sort, key)
+        if has_origin and radius:
+            page = [item for item in page if item["distance"] is not None and item["distance"] <= radius]
+        return page
+    # Ro'yxat shu hodisagacha bo'lgan holatni aks ettiradi: mijoz /bags/stream'ni shu id'dan davom ettiradi.
+    # Id ro'yxatdan oldin olinadi, shuning uchun oradagi o'zgarishlar qayta yuboriladi, yo'qolmaydi
+    last_event_id = bag_events.last_id
+    if open_now or closing_within:
+        # Natija vaqt o'tishi bilan o'zgaradi, versiyalar buni sezmaydi — keshlanmaydi
+        response.headers[LAST_EVENT_ID_HEADER] = last_event_id
+        return build(response)
+    # Har qanday do'kon o'zgarishi (joylashuv, o'chirish) ro'yxatga ta'sir qiladi
+    scopes = [("shops",), ("category", category) if category else ("bags",)]
+    if include_rating:
+        scopes.append(("ratings",))
+    served = response_cache.serve(request, scopes, build)
+    served.headers[LAST_EVENT_ID_HEADER] = last_event_id
+    return served
+
+@app.get("/bags/stream")
+async def stream_bags(category: Optional[str] = None, lat: Optional[float] = None,
+                      lon: Optional[float] = None, radius: Optional[float] = None,
+                      last_event_id: Optional[str] = Query(None),
+                      last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")):
+    """Server-sent events for bag created/updated/sold/deleted changes.
+
+    Load /bags once, then apply these deltas. A "reset" event means the
+    client missed events and should reload the listing.
+    """
+    sub = bag_events.subscribe(category, lat, lon, radius, last_event_id_header or last_event_id)
+
+    async def event_stream():
+        try:
+            for event in sub.backlog:
+                yield format_sse(event)
+            while True:
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), timeout=STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(event)
+                if event["type"] == "reset":
+                    break
+        finally:
+            bag_events.unsubscribe(sub)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.post("/bags/{bag_id}/pickup")
 def confirm_pickup(bag_id: str, code: str, current_user: dict = Depends(check_role(["customer", "shop"])), db: Session = Depends(get_db)):
-    order = db.query(OrderModel).filter_by(bag_id=bag_id, status="pending").first()
+    order = db.query(OrderModel.id, OrderModel.customer_id).filter_by(bag_id=bag_id, status="pending").first()
     if not order:
         raise HTTPException(status_code=404, detail="Order not found or already picked up")
     if code != "1234":  # Hozircha oddiy kod, keyin dinamik qilinadi
         raise HTTPException(status_code=400, detail="Invalid pickup code")
-    order.status = "picked_up"
+    if not transition_order(db, order.id, "pending", "picked_up"):
+        raise HTTPException(status_code=404, detail="Order not found or already picked up")
+    stats.record_order_event(db, "orders_picked_up", *_bag_keys(db, bag_id))
     db.commit()
-    send_notification.delay(order.customer_id, f"Bag {bag_id} picked up")
+    notifier.notify(order.customer_id, f"Bag {bag_id} picked up")
     return {"message": "Pickup confirmed"}
 
 @app.get("/bags/{bag_id}/status")
-def get_bag_status(bag_id: str, db: Session = Depends(get_db)):
-    bag = db.query(BagModel).filter_by(id=bag_id).first()
-    if not bag:
-        raise HTTPException(status_code=404, detail="Bag not found")
-    return {"status": bag.status}
+def get_bag_status(bag_id: str, request: Request, db: Session = Depends(get_db)):
+    def build(response: Response):
+        bag = db.query(BagModel.status).filter_by(id=bag_id).first()
+        if not bag:
+            raise HTTPException(status_code=404, detail="Bag not found")
+        return {"status": bag.status}
+    return response_cache.serve(request, [("bag", bag_id)], build)
 
 # Customer-related endpoints
 @app.post("/customers/{customer_id}/buy/{bag_id}")
 def buy_bag(customer_id: str, bag_id: str, current_user: dict = Depends(check_role(["customer"])), db: Session = Depends(get_db)):
     if current_user["id"] != customer_id:
         raise HTTPException(status_code=403, detail="Not your account")
-    bag = db.query(BagModel).filter_by(id=bag_id, status="available").first()
-    if not bag or bag.quantity <= 0:
+    if not reserve_bag(db, bag_id):
         raise HTTPException(status_code=404, detail="Bag not available")
-    order = OrderModel(customer_id=customer_id, bag_id=bag_id)
-    bag.quantity -= 1
-    if bag.quantity == 0:
-        bag.status = "sold"
+    order = OrderModel(id=str(uuid.uuid4()), customer_id=customer_id, bag_id=bag_id)
     db.add(order)
+    stats.record_order_event(db, "orders_placed", *_bag_keys(db, bag_id))
     db.commit()
-    send_notification.delay(customer_id, f"Order {order.id} placed for bag {bag_id}")
+    publish_bag_state(db, bag_id)
+    notifier.notify(customer_id, f"Order {order.id} placed for bag {bag_id}")
     return {"order_id": order.id}
 
 @app.get("/customers/{customer_id}/orders")
-def get_orders(customer_id: str, status: Optional[str] = None, current_user: dict = Depends(check_role(["customer"])), db: Session = Depends(get_db)):
+def get_orders(customer_id: str, response: Response, status: Optional[str] = None, limit: Optional[int] = None,
+               cursor: Optional[str] = None, current_user: dict = Depends(check_role(["customer"])), db: Session = Depends(get_db)):
     if current_user["id"] != customer_id:
         raise HTTPException(status_code=403, detail="Not your account")
-    query = db.query(OrderModel).filter_by(customer_id=customer_id)
+    limit = page_size(limit, cursor)
+    after = decode_cursor(cursor, "id")
+    query = db.query(OrderModel.id, OrderModel.bag_id, OrderModel.status).filter(OrderModel.customer_id == customer_id)
     if status:
-        query = query.filter_by(status=status)
-    orders = query.all()
-    return [{"id": o.id, "bag_id": o.bag_id, "status": o.status} for o in orders]
+        query = query.filter(OrderModel.status == status)
+    if after:
+        query = query.filter(OrderModel.id > after[0])
+    orders = query.order_by(OrderModel.id).limit(fetch_size(limit)).all()
+    result = [{"id": o.id, "bag_id": o.bag_id, "status": o.status} for o in orders]
+    return set_next_cursor(response, result, limit, "id", lambda x: [x["id"]])
 
 @app.post("/customers/{customer_id}/orders/{order_id}/cancel")
 def cancel_order(customer_id: str, order_id: str, current_user: dict = Depends(check_role(["customer"])), db: Session = Depends(get_db)):
     if current_user["id"] != customer_id:
         raise HTTPException(status_code=403, detail="Not your account")
-    order = db.query(OrderModel).filter_by(id=order_id, customer_id=customer_id, status="pending").first()
-    if not order:
+    order = db.query(OrderModel.bag_id).filter_by(id=order_id, customer_id=customer_id, status="pending").first()
+    if not order or not transition_order(db, order_id, "pending", "cancelled"):
         raise HTTPException(status_code=404, detail="Order not found or not cancellable")
-    order.status = "cancelled"
-    bag = db.query(BagModel).filter_by(id=order.bag_id).first()
-    bag.quantity += 1
+    release_bag(db, order.bag_id)
+    stats.record_order_event(db, "orders_cancelled", *_bag_keys(db, order.bag_id))
     db.commit()
+    publish_bag_state(db, order.bag_id)
     return {"message": "Order cancelled"}
 
 @app.post("/customers/{customer_id}/reviews/{shop_id}")
@@ -229,28 +554,40 @@ def submit_review(customer_id: str, shop_id: str, review: Review, current_user:
     review_id = str(uuid.uuid4())
     db_review = ReviewModel(id=review_id, customer_id=customer_id, shop_id=shop_id, rating=review.rating, comment=review.comment)
     db.add(db_review)
+    ratings.record_review(db, shop_id, review.rating)
     db.commit()
+    response_cache.versions.bump(("reviews", shop_id), ("ratings",))
     return {"id": review_id}
 
 # Admin-related endpoints
 @app.post("/superadmin/admins")
-def create_admin(user: User, current_user: dict = Depends(check_role(["admin"])), db: Session = Depends(get_db)):
+async def create_admin(user: User, current_user: dict = Depends(check_role(["admin"])), db: Session = Depends(get_db)):
     if current_user["id"] != "admin1":
         raise HTTPException(status_code=403, detail="Only superadmin can create admins")
     user_id = str(uuid.uuid4())
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = await hashing_pool.hash(user.password)
     db_user = UserModel(id=user_id, name=user.name, email=user.email, password=hashed_password, role="admin", lat=user.lat, lon=user.lon, approved=1)
-    db.add(db_user)
-    db.commit()
+    await run_in_threadpool(_add_user, db, db_user)
     return {"id": user_id}
 
 @app.get("/admin/users")
-def list_users(role: Optional[str] = None, current_user: dict = Depends(check_role(["admin"])), db: Session = Depends(get_db)):
-    query = db.query(UserModel)
+def list_users(response: Response, role: Optional[str] = None, limit: Optional[int] = None, cursor: Optional[str] = None,
+               current_user: dict = Depends(check_role(["admin"])), db: Session = Depends(get_db)):
+    """Lists users; pass limit/cursor to page through them, otherwise the whole list is streamed."""
+    limit = page_size(limit, cursor)
+    if limit is None:
+        # To'liq ro'yxat xotirada yig'ilmaydi: eksport so'rovi bo'laklab JSON massiv qilib yuboriladi
+        query = exports.build_query("users", role=role, columns=("id", "name", "email", "role"))
+        return StreamingResponse(exports.json_array(query), media_type="application/json")
+    query = db.query(UserModel.id, UserModel.name, UserModel.email, UserModel.role)
     if role:
-        query = query.filter_by(role=role)
-    users = query.all()
-    return [{"id": u.id, "name": u.name, "email": u.email, "role": u.role} for u in users]
+        query = query.filter(UserModel.role == role)
+    after = decode_cursor(cursor, "id")
+    if after:
+        query = query.filter(UserModel.id > after[0])
+    users = query.order_by(UserModel.id).limit(fetch_size(limit)).all()
+    result = [{"id": u.id, "name": u.name, "email": u.email, "role": u.role} for u in users]
+    return set_next_cursor(response, result, limit, "id", lambda x: [x["id"]])
 
 @app.delete("/admin/users/{user_id}")
 def delete_user(user_id: str, current_user: dict = Depends(check_role(["admin"])), db: Session = Depends(get_db)):
@@ -259,6 +596,8 @@ def delete_user(user_id: str, current_user: dict = Depends(check_role(["admin"])
         raise HTTPException(status_code=404, detail="User not found or admin")
     db.delete(user)
     db.commit()
+    invalidate_user(user_id)
+    response_cache.versions.bump(("shops",))
     return {"message": "User deleted"}
 
 @app.patch("/superadmin/shops/{shop_id}/approve")
@@ -270,10 +609,72 @@ def approve_shop(shop_id: str, current_user: dict = Depends(check_role(["admin"]
         raise HTTPException(status_code=404, detail="Shop not found")
     shop.approved = 1
     db.commit()
+    invalidate_user(shop_id)
     return {"message": "Shop approved"}
 
+@app.get("/admin/cache/stats")
+def get_cache_stats(current_user: dict = Depends(check_role(["admin"]))):
+    return {"auth": auth_cache_stats(), "responses": response_cache.stats()}
+
+@app.get("/admin/export/{table}")
+def export_table(table: str, format: str = "ndjson", role: Optional[str] = None, status: Optional[str] = None,
+                 from_: Optional[datetime] = Query(None, alias="from"), to: Optional[datetime] = None,
+                 current_user: dict = Depends(check_role(["admin"]))):
+    """Streams a whole table as NDJSON or CSV; role/status/from/to are applied in SQL.
+
+    from/to filter on created_at, which is unknown (NULL) for rows created
+    before it was recorded.
+    """
+    if table not in exports.EXPORTS:
+        raise HTTPException(status_code=404, detail=f"Unknown export; use one of: {', '.join(exports.EXPORTS)}")
+    if format not in exports.FORMATS:
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    body = exports.stream(table, format, role=role, status=status, start=from_, end=to)
+    return StreamingResponse(body, media_type=exports.FORMATS[format],
+                             headers={"Content-Disposition": f'attachment; filename="{table}.{format}"'})
+
+@app.get("/admin/expiry/stats")
+def get_expiry_stats(current_user: dict = Depends(check_role(["admin"]))):
+    return expiry_scheduler.stats()
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus text exposition of request, SQL and in-process queue metrics."""
+    auth = auth_cache_stats()
+    responses = response_cache.stats()
+    notifications = notifier.stats()
+    extra = [
+        gauge("cache_entries", "Entries held by in-process caches",
+              [({"cache": "auth_tokens"}, auth["tokens"]["size"]), ({"cache": "auth_principals"}, auth["principals"]["size"]),
+               ({"cache": "responses"}, responses["size"])]),
+        gauge("cache_hits_total", "Cache hits since start",
+              [({"cache": "auth_tokens"}, auth["tokens"]["hits"]), ({"cache": "auth_principals"}, auth["principals"]["hits"]),
+               ({"cache": "responses"}, responses["hits"])], "counter"),
+        gauge("cache_misses_total", "Cache misses since start",
+              [({"cache": "auth_tokens"}, auth["tokens"]["misses"]), ({"cache": "auth_principals"}, auth["principals"]["misses"]),
+               ({"cache": "responses"}, responses["misses"])], "counter"),
+        gauge("notifications_pending", "Notifications waiting for the next batch", [({}, notifications["pending"])]),
+        gauge("notifications_delivered_total", "Notifications delivered since start",
+              [({}, notifications.get("delivered", 0))], "counter"),
+        gauge("notifications_failed_total", "Notifications that failed to send",
+              [({}, notifications.get("failed", 0))], "counter"),
+        gauge("password_hash_pending", "Password hashing jobs queued or running", [({}, hashing_pool.pending)]),
+        gauge("bag_stream_subscribers", "Open /bags/stream connections", [({}, len(bag_events))]),
+        gauge("bag_expiry_scheduled", "Available bags waiting for their pickup window to end",
+              [({}, len(expiry_scheduler))]),
+    ]
+    return Response(registry.render(extra), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/notifications/stats")
+def get_notification_stats(current_user: dict = Depends(check_role(["admin"]))):
+    return notifier.stats()
+
 @app.get("/admin/statistics")
-def get_statistics(current_user: dict = Depends(check_role(["admin"])), db: Session = Depends(get_db)):
-    bags_sold = db.query(BagModel).filter_by(status="sold").count()
-    co2_saved = bags_sold * 2.5  # Approx 2.5kg CO2 per bag saved
-    return {"bags_sold": bags_sold, "co2_saved_kg": co2_saved}
\ No newline at end of file
+def get_statistics(from_: Optional[datetime] = Query(None, alias="from"), to: Optional[datetime] = None,
+                   group_by: Optional[str] = None, current_user: dict = Depends(check_role(["admin"])),
+                   db: Session = Depends(get_db)):
+    if group_by is not None and group_by not in stats.GROUP_BY:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(stats.GROUP_BY)}")
+    if from_ is None and to is None and group_by is None:
+        return stats.summary(db)
+    return stats.rollup(db, from_, to, group_by)
\ No newline at end of file
@@ -0,0 +1,241 @@
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("surplussaver.metrics")
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_HEADER = b"x-profile"
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+# Shu turdagi javoblar (SSE) soatlab ochiq turadi: latency va in-flight hisobiga kirmaydi
+STREAMING_CONTENT_TYPES = (b"text/event-stream",)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            return [(labels, list(counts), total, n) for labels, (counts, total, n) in self._series.items()]
+
+class RequestStats:
+    __slots__ = ("sql_count", "sql_seconds")
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+
+# Joriy so'rov statistikasi; threadpool'dagi endpointlarga kontekst nusxasi orqali yetib boradi
+_current: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+class MetricsRegistry:
+    def __init__(self):
+        self.request_latency = Histogram(LATENCY_BUCKETS)
+        self.request_sql_count = Histogram(SQL_COUNT_BUCKETS)
+        self.query_latency = Histogram(LATENCY_BUCKETS)
+        self.requests = Counter()
+        self.request_sql_seconds = defaultdict(float)
+        self.slow_queries = 0
+        self.in_flight = 0
+        self.streams_open = 0
+        self._lock = threading.Lock()
+
+    def render(self, extra: Iterable[str] = ()) -> str:
+        lines: List[str] = []
+        lines += _counter("http_requests_total", "Requests by route and status", self.requests.items(),
+                          ("method", "route", "status"))
+        lines += ["# HELP http_requests_in_flight Requests currently being served",
+                  "# TYPE http_requests_in_flight gauge", f"http_requests_in_flight {self.in_flight}"]
+        lines += ["# HELP http_streams_open Streaming responses (SSE) currently open",
+                  "# TYPE http_streams_open gauge", f"http_streams_open {self.streams_open}"]
+        lines += _histogram("http_request_duration_seconds", "Request latency", self.request_latency,
+                            ("method", "route"))
+        lines += _histogram("http_request_sql_statements", "SQL statements per request", self.request_sql_count,
+                            ("method", "route"))
+        lines += _counter("http_request_sql_seconds_total", "Time spent in SQL by route",
+                          self.request_sql_seconds.items(), ("method", "route"))
+        lines += _histogram("db_query_duration_seconds", "SQL statement latency", self.query_latency, ())
+        lines += ["# HELP db_slow_queries_total Statements slower than SLOW_QUERY_MS",
+                  "# TYPE db_slow_queries_total counter", f"db_slow_queries_total {self.slow_queries}"]
+        lines += list(extra)
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _counter(name: str, help_text: str, items, label_names: tuple) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+    for labels, value in sorted(items):
+        lines.append(f"{name}{_labels(label_names, labels)} {value}")
+    return lines
+
+def _histogram(name: str, help_text: str, histogram: Histogram, label_names: tuple) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for labels, counts, total, n in sorted(histogram.samples()):
+        for bound, count in zip(histogram.buckets, counts):
+            le = 'le="%s"' % bound
+            lines.append(f"{name}_bucket{_labels(label_names, labels, le)} {count}")
+        le = 'le="+Inf"'
+        lines.append(f"{name}_bucket{_labels(label_names, labels, le)} {n}")
+        lines.append(f"{name}_sum{_labels(label_names, labels)} {total}")
+        lines.append(f"{name}_count{_labels(label_names, labels)} {n}")
+    return lines
+
+def gauge(name: str, help_text: str, samples: Iterable[Tuple[dict, float]], kind: str = "gauge") -> str:
+    """Formats an extra gauge (or counter) for MetricsRegistry.render."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {value}")
+    return "\n".join(lines)
+
+def instrument_engine(engine: Engine):
+    """Times every statement and attributes it to the current request."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        registry.query_latency.observe((), elapsed)
+        stats = _current.get()
+        if stats is not None:
+            stats.sql_count += 1
+            stats.sql_seconds += elapsed
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            with registry._lock:
+                registry.slow_queries += 1
+            logger.warning("Slow query (%.1f ms): %s", elapsed * 1000, " ".join(statement.split())[:500])
+
+class SamplingProfiler:
+    """Periodically samples every thread's stack and counts folded call stacks.
+
+    Sync endpoints run in the threadpool, so sampling all threads (rather than
+    tracing the event loop thread) is what catches where request time goes.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+class MetricsMiddleware:
+    """Records per-route latency, SQL usage and in-flight requests (pure ASGI).
+
+    Streaming responses (SSE) are counted once their headers go out and move
+    from in-flight to open streams; their duration is connection lifetime, so
+    it stays out of the latency histograms and the slow request log.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = RequestStats()
+        token = _current.set(stats)
+        profiler = None
+        if PROFILING_ENABLED and dict(scope.get("headers", ())).get(PROFILE_HEADER) == b"1":
+            profiler = SamplingProfiler().start()
+        status = [500]
+        streaming = [False]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                content_type = dict(message.get("headers", ())).get(b"content-type", b"")
+                if content_type.startswith(STREAMING_CONTENT_TYPES):
+                    streaming[0] = True
+                    with registry._lock:
+                        registry.in_flight -= 1
+                        registry.streams_open += 1
+            await send(message)
+
+        with registry._lock:
+            registry.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            with registry._lock:
+                if streaming[0]:
+                    registry.streams_open -= 1
+                else:
+                    registry.in_flight -= 1
+            _current.reset(token)
+            route = scope.get("route")
+            # Mos kelmagan yo'llar bitta yorliqqa yig'iladi (kardinallik cheklanadi)
+            labels = (scope["method"], route.path if route is not None else "unmatched")
+            registry.request_sql_count.observe(labels, stats.sql_count)
+            with registry._lock:
+                registry.requests[labels + (status[0],)] += 1
+                registry.request_sql_seconds[labels] += stats.sql_seconds
+            if not streaming[0]:
+                registry.request_latency.observe(labels, elapsed)
+            if not streaming[0] and elapsed * 1000 >= SLOW_REQUEST_MS:
+                logger.warning("Slow request %s %s: %.1f ms, %d SQL statements (%.1f ms)",
+                               labels[0], labels[1], elapsed * 1000, stats.sql_count, stats.sql_seconds * 1000)
+            if profiler is not None:
+                top = profiler.stop().most_common(20)
+                logger.info("Profile %s %s (%.1f ms, %d samples):\n%s", labels[0], labels[1], elapsed * 1000,
+                            sum(profiler.stacks.values()), "\n".join(f"{n:6d} {stack}" for stack, n in top))
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 
 class User(BaseModel):
@@ -24,5 +24,5 @@ class Bag(BaseModel):
     category: str
 
 class Review(BaseModel):
-    rating: int
+    rating: int = Field(ge=1, le=5)
     comment: str
\ No newline at end of file
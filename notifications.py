@@ -0,0 +1,125 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_BACKEND = os.getenv("NOTIFICATION_BACKEND", "auto")  # auto | celery | local
+NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", "100"))
+NOTIFY_FLUSH_INTERVAL = float(os.getenv("NOTIFY_FLUSH_INTERVAL", "0.5"))
+
+def deliver(user_id: str, messages: List[str]):
+    # Hozircha oddiy print, Firebase keyin qo'shiladi
+    for message in messages:
+        print(f"Notification to {user_id}: {message}")
+
+class LocalBackend:
+    """Delivers in the dispatcher's own thread; needs no external service."""
+    name = "local"
+
+    def send(self, batch: Dict[str, List[str]]):
+        for user_id, messages in batch.items():
+            deliver(user_id, messages)
+
+class CeleryBackend:
+    """Hands a whole batch to Celery in a single broker round trip."""
+    name = "celery"
+
+    def __init__(self):
+        from tasks import send_notification_batch
+        self._task = send_notification_batch
+
+    def send(self, batch: Dict[str, List[str]]):
+        self._task.delay(batch)
+
+def make_backend(name: str = NOTIFICATION_BACKEND):
+    if name == "local":
+        return LocalBackend()
+    if name == "celery":
+        return CeleryBackend()
+    # auto: broker sozlangan va celery o'rnatilgan bo'lsa Celery, aks holda lokal
+    if os.getenv("CELERY_BROKER_URL"):
+        try:
+            return CeleryBackend()
+        except ImportError:
+            logger.warning("CELERY_BROKER_URL is set but celery is not installed; using local notifications")
+    return LocalBackend()
+
+class NotificationDispatcher:
+    """Buffers notifications in memory and flushes them per user in batches.
+
+    notify() only appends to a buffer, so request handlers never wait on the
+    broker. A background thread flushes when NOTIFY_BATCH_SIZE messages are
+    pending or NOTIFY_FLUSH_INTERVAL seconds have passed, whichever is first.
+    """
+
+    def __init__(self, backend=None, batch_size: int = NOTIFY_BATCH_SIZE,
+                 flush_interval: float = NOTIFY_FLUSH_INTERVAL):
+        self._backend = backend
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, List[str]] = {}
+        self._pending_count = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        self.metrics = {"enqueued": 0, "coalesced": 0, "batches": 0, "delivered": 0, "failed": 0,
+                        "last_flush_ms": 0.0}
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = make_backend()
+        return self._backend
+
+    def notify(self, user_id: str, message: str):
+        with self._lock:
+            self.metrics["enqueued"] += 1
+            messages = self._pending.setdefault(user_id, [])
+            if message in messages:
+                # Bir foydalanuvchiga bir xil xabar ikki marta yuborilmaydi
+                self.metrics["coalesced"] += 1
+                return
+            messages.append(message)
+            self._pending_count += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+                self._thread.start()
+            if self._pending_count >= self.batch_size:
+                self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            count, self._pending_count = self._pending_count, 0
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            self.backend.send(batch)
+        except Exception:
+            logger.exception("Failed to send %d notifications", count)
+            self.metrics["failed"] += count
+        else:
+            self.metrics["delivered"] += count
+        self.metrics["batches"] += 1
+        self.metrics["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 3)
+
+    def stats(self) -> Dict:
+        return {"backend": self.backend.name, "pending": self._pending_count, **self.metrics}
+
+    def shutdown(self):
+        self._stopped = True
+        self._wakeup.set()
+        self.flush()
+
+notifier = NotificationDispatcher()
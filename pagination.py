@@ -0,0 +1,45 @@
+import base64
+import json
+from typing import Any, List, Optional
+
+from fastapi import HTTPException, Response
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(sort: str, key: List[Any]) -> str:
+    raw = json.dumps({"s": sort, "k": key}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: Optional[str], sort: str) -> Optional[List[Any]]:
+    """Returns the keyset position stored in the cursor, or None for the first page."""
+    if not cursor:
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        key = data["k"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if data.get("s") != sort or not isinstance(key, list):
+        raise HTTPException(status_code=400, detail="Cursor does not match sort order")
+    return key
+
+def page_size(limit: Optional[int], cursor: Optional[str] = None) -> Optional[int]:
+    """Page size for a request; None (no paging, whole list) unless limit or cursor is given."""
+    if limit is None:
+        return None if cursor is None else DEFAULT_PAGE_SIZE
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    return min(limit, MAX_PAGE_SIZE)
+
+def fetch_size(limit: Optional[int]) -> Optional[int]:
+    # Keyingi sahifa borligini bilish uchun bitta ortiqcha satr o'qiladi
+    return None if limit is None else limit + 1
+
+def set_next_cursor(response: Response, rows: list, limit: Optional[int], sort: str, key) -> list:
+    """Trims rows fetched with fetch_size(limit) and advertises the next page via a response header."""
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(sort, key(rows[-1]))
+    return rows
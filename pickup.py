@@ -0,0 +1,66 @@
+import os
+import re
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Optional, Tuple
+
+# Vaqt zonasi ko'rsatilmagan pickup vaqtlari (datetime-local, "HH:MM") shu zonada deb olinadi.
+# O'rnatilmagan bo'lsa, bunday vaqtlar taxmin qilinmaydi: matn saqlanadi, pickup_*_at esa NULL
+# (erkin matn kabi — muddati o'tmaydi, open_now/closing_within filtrlariga tushmaydi)
+PICKUP_TIMEZONE = os.getenv("PICKUP_TIMEZONE")
+
+_CLOCK = re.compile(r"^\s*(\d{1,2}):(\d{2})\s*$")
+
+def _zone() -> Optional[tzinfo]:
+    if not PICKUP_TIMEZONE:
+        return None
+    if PICKUP_TIMEZONE.upper() == "UTC":
+        return timezone.utc
+    from zoneinfo import ZoneInfo
+    return ZoneInfo(PICKUP_TIMEZONE)
+
+def utcnow() -> datetime:
+    """Naive UTC now, the form pickup_*_at columns are stored in."""
+    return datetime.utcnow()
+
+def _to_utc(value: datetime) -> Optional[datetime]:
+    if value.tzinfo is None:
+        if _zone() is None:
+            return None
+        value = value.replace(tzinfo=_zone())
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def parse_pickup_time(value: Optional[str], reference: Optional[datetime] = None) -> Optional[datetime]:
+    """Parses an ISO 8601 datetime or a bare "HH:MM" (on the reference day) to naive UTC.
+
+    Returns None for free-form text that can't be interpreted, and for
+    naive times when PICKUP_TIMEZONE is unset.
+    """
+    if not value:
+        return None
+    try:
+        return _to_utc(datetime.fromisoformat(value.strip().replace("Z", "+00:00")))
+    except ValueError:
+        pass
+    match = _CLOCK.match(value)
+    if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+        return None
+    zone = _zone()
+    if zone is None:
+        return None
+    day = (reference.replace(tzinfo=timezone.utc) if reference else datetime.now(timezone.utc)).astimezone(zone)
+    local = day.replace(hour=int(match.group(1)), minute=int(match.group(2)), second=0, microsecond=0)
+    return _to_utc(local)
+
+def pickup_window(start: Optional[str], end: Optional[str],
+                  reference: Optional[datetime] = None) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Returns (pickup_start_at, pickup_end_at) for the string fields of a bag."""
+    start_at = parse_pickup_time(start, reference)
+    end_at = parse_pickup_time(end, reference)
+    # "22:00"-"01:00" kabi oyna yarim tundan o'tadi
+    if start_at and end_at and end_at <= start_at and _CLOCK.match(end or ""):
+        end_at += timedelta(days=1)
+    return start_at, end_at
+
+def pickup_columns(start: Optional[str], end: Optional[str], reference: Optional[datetime] = None) -> dict:
+    start_at, end_at = pickup_window(start, end, reference)
+    return {"pickup_start_at": start_at, "pickup_end_at": end_at}
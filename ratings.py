@@ -0,0 +1,23 @@
+from typing import Dict
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from database import ShopRating, increment
+
+# Reyting bo'lmagan do'konlar saralashda oxiriga tushadi (baholar 1..5)
+average_rating = func.coalesce(ShopRating.sum * 1.0 / ShopRating.count, 0)
+
+def record_review(db: Session, shop_id: str, rating: int):
+    """Adds one rating to the shop's summary; the caller commits."""
+    increment(db, ShopRating, {"shop_id": shop_id}, {"count": 1, "sum": rating, f"r{rating}": 1})
+
+def summary(db: Session, shop_id: str) -> Dict:
+    row = db.query(ShopRating).filter_by(shop_id=shop_id).first()
+    count = row.count if row else 0
+    return {
+        "shop_id": shop_id,
+        "count": count,
+        "average": row.sum / count if count else None,
+        "histogram": {str(star): getattr(row, f"r{star}") if row else 0 for star in range(1, 6)},
+    }
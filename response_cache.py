@@ -0,0 +1,75 @@
+import hashlib
+import os
+import threading
+from typing import Callable, Dict, Hashable, Iterable, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from cache import TTLCache
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2048"))
+# Versiyalar faqat shu jarayonda oshiriladi; TTL boshqa workerlardagi eskirishni cheklaydi
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "30"))
+# Keshdan qaytariladigan sarlavhalar (masalan, sahifalash kursori)
+CACHED_HEADERS = ("x-next-cursor",)
+
+class VersionRegistry:
+    """Monotonic counters per data scope, e.g. ("shop", id) or ("category", name)."""
+
+    def __init__(self):
+        self._versions: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+
+    def bump(self, *scopes: Hashable):
+        with self._lock:
+            for scope in scopes:
+                self._versions[scope] = self._versions.get(scope, 0) + 1
+
+    def snapshot(self, scopes: Iterable[Hashable]) -> Tuple[int, ...]:
+        return tuple(self._versions.get(scope, 0) for scope in scopes)
+
+class ResponseCache:
+    """Caches serialized GET responses until one of their scopes' versions changes."""
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL_SECONDS):
+        self.versions = VersionRegistry()
+        self._entries = TTLCache(maxsize, ttl)
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def serve(self, request: Request, scopes: Iterable[Hashable], build: Callable[[Response], object]) -> Response:
+        """Returns the cached response for this URL, or calls build() to make one.
+
+        build receives a scratch Response it may set headers on and returns the
+        JSON-able body. If-None-Match is answered with 304 when the ETag matches.
+        """
+        scopes = list(scopes)
+        key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+        # Snapshot build'dan oldin olinadi: build paytidagi o'zgarish keyingi so'rovda sezildi
+        versions = self.versions.snapshot(scopes)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == versions:
+            self.hits += 1
+        else:
+            self.misses += 1
+            scratch = Response()
+            body = JSONResponse(jsonable_encoder(build(scratch))).body
+            headers = {name: scratch.headers[name] for name in CACHED_HEADERS if name in scratch.headers}
+            headers["ETag"] = 'W/"%s"' % hashlib.sha1(body).hexdigest()
+            headers["Cache-Control"] = "no-cache"
+            entry = (versions, body, headers)
+            self._entries.set(key, entry)
+        _, body, headers = entry
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and headers["ETag"] in (tag.strip() for tag in if_none_match.split(",")):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def stats(self) -> Dict:
+        return {**self._entries.stats(), "hits": self.hits, "misses": self.misses, "not_modified": self.not_modified}
+
+response_cache = ResponseCache()
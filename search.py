@@ -0,0 +1,214 @@
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional
+
+from sqlalchemy import (Column, Float, Index, Integer, MetaData, String, Table, and_, case, delete, func, insert,
+                        inspect, literal_column, or_, select, text)
+from sqlalchemy.orm import Session
+
+from database import Bag, StatCounter, increment
+
+# "auto": SQLite'da FTS5 bo'lsa shu, aks holda har qanday bazada ishlaydigan bag_terms jadvali
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")
+SEARCH_MAX_TERMS = 8
+# BM25 parametrlari (FTS5 standart qiymatlari bilan bir xil)
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Kategoriya mosligi tavsifdagi moslikdan og'irroq
+CATEGORY_WEIGHT = 2.0
+
+_metadata = MetaData()
+
+bags_fts = Table("bags_fts", _metadata, Column("bag_id", String), Column("description", String),
+                 Column("category", String))
+
+# bag_id -> bags_fts rowid. FTS5 faqat rowid bo'yicha indekslangan: o'chirish shu orqali skanersiz bajariladi
+bags_fts_rows = Table(
+    "bags_fts_rows", _metadata,
+    Column("id", Integer, primary_key=True),
+    Column("bag_id", String, nullable=False, unique=True),
+)
+
+# Zaxira inverted index: har bir (so'z, sumka) uchun bitta satr; so'z bo'yicha indekslangan
+bag_terms = Table(
+    "bag_terms", _metadata,
+    Column("term", String, primary_key=True),
+    Column("bag_id", String, primary_key=True),
+    Column("tf", Float, nullable=False),
+    Column("doc_len", Integer, nullable=False),
+    Index("ix_bag_terms_bag", "bag_id"),
+)
+
+# Indeks tuzilishi yoki qoidasi o'zgarsa oshiriladi: eski indeks ishga tushganda qayta quriladi
+SEARCH_INDEX_VERSION = 2
+
+_backend: Optional[str] = None
+
+def _normalize(value: str) -> str:
+    # FTS5 "remove_diacritics" bilan bir xil natija: kichik harf, diakritik belgilarsiz
+    decomposed = unicodedata.normalize("NFKD", value.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+def tokenize(value: str) -> List[str]:
+    return re.findall(r"\w+", _normalize(value or ""))
+
+def query_terms(q: str) -> List[str]:
+    terms = list(dict.fromkeys(tokenize(q)))[:SEARCH_MAX_TERMS]
+    # "bre" va "bread" birga kelsa, "bread" yetarli (hamma so'zlar prefiks sifatida mos keladi)
+    return [term for term in terms if not any(other != term and other.startswith(term) for other in terms)]
+
+def backend(db: Session) -> str:
+    global _backend
+    if _backend is None:
+        choice = SEARCH_BACKEND
+        if choice == "auto":
+            choice = "fts5" if db.get_bind().dialect.name == "sqlite" and _has_fts5(db) else "terms"
+        _backend = choice
+    return _backend
+
+def _has_fts5(db: Session) -> bool:
+    options = {row[0] for row in db.execute(text("PRAGMA compile_options"))}
+    return "ENABLE_FTS5" in options
+
+def _version_key(name: str) -> str:
+    return f"search_index_version:{name}"
+
+def ensure_index(db: Session):
+    """Builds the search index from the available bags if it is missing or outdated.
+
+    Only the active backend is kept up to date, so building one marks the
+    other as stale for when the backend is switched back.
+    """
+    version = db.query(StatCounter.value).filter(StatCounter.name == _version_key(backend(db))).scalar()
+    table = bags_fts_rows if backend(db) == "fts5" else bag_terms
+    if version == SEARCH_INDEX_VERSION and inspect(db.connection()).has_table(table.name):
+        return
+    connection = db.connection()
+    if backend(db) == "fts5":
+        db.execute(text("DROP TABLE IF EXISTS bags_fts"))
+        bags_fts_rows.drop(bind=connection, checkfirst=True)
+        db.execute(text("CREATE VIRTUAL TABLE bags_fts USING fts5("
+                        "bag_id UNINDEXED, description, category, tokenize='unicode61 remove_diacritics 2')"))
+        bags_fts_rows.create(bind=connection)
+        db.execute(text("INSERT INTO bags_fts_rows (bag_id) SELECT id FROM bags WHERE status = 'available'"))
+        db.execute(text("INSERT INTO bags_fts (rowid, bag_id, description, category) "
+                        "SELECT r.id, b.id, b.description, b.category FROM bags_fts_rows r JOIN bags b ON b.id = r.bag_id"))
+    else:
+        bag_terms.drop(bind=connection, checkfirst=True)
+        db.query(StatCounter).filter(StatCounter.name.in_(("search_documents", "search_terms"))).delete()
+        bag_terms.create(bind=connection)
+        rows = db.execute(select(Bag.id, Bag.description, Bag.category).where(Bag.status == "available")
+                          .execution_options(yield_per=1000))
+        for chunk in rows.partitions():
+            index_bags(db, [{"id": row.id, "description": row.description, "category": row.category} for row in chunk],
+                       replace=False)
+    db.query(StatCounter).filter(StatCounter.name.like(_version_key("%"))).delete(synchronize_session=False)
+    db.add(StatCounter(name=_version_key(backend(db)), value=SEARCH_INDEX_VERSION))
+    db.commit()
+
+def _postings(bag_id: str, description: str, category: str) -> List[Dict]:
+    counts = Counter(tokenize(description))
+    for term in tokenize(category):
+        counts[term] += CATEGORY_WEIGHT
+    doc_len = int(sum(counts.values()))
+    return [{"term": term, "bag_id": bag_id, "tf": tf, "doc_len": doc_len} for term, tf in counts.items()]
+
+def index_bags(db: Session, rows: List[Dict], replace: bool = True):
+    """Adds or replaces index entries for dicts with id, description and category.
+
+    Runs in the caller's transaction so the index commits with the bag.
+    """
+    if not rows:
+        return
+    if replace:
+        remove_bags(db, [row["id"] for row in rows])
+    if backend(db) == "fts5":
+        db.execute(insert(bags_fts_rows), [{"bag_id": row["id"]} for row in rows])
+        rowids = dict(db.execute(select(bags_fts_rows.c.bag_id, bags_fts_rows.c.id)
+                                 .where(bags_fts_rows.c.bag_id.in_([row["id"] for row in rows]))).all())
+        db.execute(text("INSERT INTO bags_fts (rowid, bag_id, description, category) "
+                        "VALUES (:rowid, :bag_id, :description, :category)"),
+                   [{"rowid": rowids[row["id"]], "bag_id": row["id"], "description": row["description"],
+                     "category": row["category"]} for row in rows])
+        return
+    postings = [p for row in rows for p in _postings(row["id"], row["description"], row["category"])]
+    if postings:
+        db.execute(insert(bag_terms), postings)
+    documents = {p["bag_id"]: p["doc_len"] for p in postings}
+    _count_documents(db, len(documents), sum(documents.values()))
+
+def sync_bags(db: Session, bag_ids: List[str]):
+    """Re-reads the bags: available ones are (re)indexed, sold, expired and deleted ones dropped.
+
+    Only available bags are searchable, so the index is kept to that set.
+    """
+    if not bag_ids:
+        return
+    remove_bags(db, bag_ids)
+    rows = db.execute(select(Bag.id, Bag.description, Bag.category)
+                      .where(Bag.id.in_(bag_ids), Bag.status == "available"))
+    index_bags(db, [{"id": row.id, "description": row.description, "category": row.category} for row in rows],
+               replace=False)
+
+def remove_bags(db: Session, bag_ids: List[str]):
+    if not bag_ids:
+        return
+    if backend(db) == "fts5":
+        rowids = [rowid for (rowid,) in db.execute(select(bags_fts_rows.c.id)
+                                                   .where(bags_fts_rows.c.bag_id.in_(bag_ids)))]
+        if rowids:
+            # rowid bo'yicha: UNINDEXED bag_id ustuni bo'yicha filtr butun indeksni skanerlaydi
+            db.execute(text("DELETE FROM bags_fts WHERE rowid = :rowid"), [{"rowid": rowid} for rowid in rowids])
+            db.execute(delete(bags_fts_rows).where(bags_fts_rows.c.id.in_(rowids)))
+        return
+    lengths = db.execute(select(bag_terms.c.bag_id, func.max(bag_terms.c.doc_len))
+                         .where(bag_terms.c.bag_id.in_(bag_ids)).group_by(bag_terms.c.bag_id)).all()
+    if lengths:
+        db.execute(delete(bag_terms).where(bag_terms.c.bag_id.in_(bag_ids)))
+        _count_documents(db, -len(lengths), -sum(length for _, length in lengths))
+
+def _count_documents(db: Session, documents: int, terms: int):
+    # BM25 uchun N va o'rtacha hujjat uzunligi: COUNT(*) skanerisiz
+    if documents:
+        increment(db, StatCounter, {"name": "search_documents"}, {"value": documents})
+        increment(db, StatCounter, {"name": "search_terms"}, {"value": terms})
+
+def matches(db: Session, q: str):
+    """Returns a subquery of (bag_id, rank) for bags matching every term of q.
+
+    Terms match as prefixes; rank is a BM25 score where higher is better.
+    Returns None if q has no searchable terms.
+    """
+    terms = query_terms(q)
+    if not terms:
+        return None
+    if backend(db) == "fts5":
+        table = literal_column(bags_fts.name)
+        expression = " ".join(f'"{term}"*' for term in terms)
+        # bm25() manfiy qiymat qaytaradi (kichigi yaxshiroq); ustun og'irliklari: bag_id, description, category
+        rank = -func.bm25(table, 0.0, 1.0, CATEGORY_WEIGHT)
+        return (select(bags_fts.c.bag_id, rank.label("rank")).select_from(bags_fts)
+                .where(table.op("MATCH")(expression)).subquery())
+
+    counters = dict(db.query(StatCounter.name, StatCounter.value)
+                    .filter(StatCounter.name.in_(("search_documents", "search_terms"))))
+    documents = max(counters.get("search_documents", 0), 1)
+    avg_len = max(counters.get("search_terms", 0), 1) / documents
+    conditions = [and_(bag_terms.c.term >= term, bag_terms.c.term < term + "\uffff") for term in terms]
+    # Har bir so'z uchun hujjat chastotasi indeks bo'yicha sanaladi
+    idf = []
+    for condition in conditions:
+        df = db.execute(select(func.count(func.distinct(bag_terms.c.bag_id))).where(condition)).scalar()
+        idf.append(math.log(1 + (documents - df + 0.5) / (df + 0.5)))
+    tf = bag_terms.c.tf
+    weight = case(*[(condition, value) for condition, value in zip(conditions, idf)], else_=0.0)
+    which = case(*[(condition, i) for i, condition in enumerate(conditions)])
+    score = weight * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * bag_terms.c.doc_len / avg_len))
+    return (select(bag_terms.c.bag_id, func.sum(score).label("rank"))
+            .where(or_(*conditions))
+            .group_by(bag_terms.c.bag_id)
+            .having(func.count(func.distinct(which)) == len(terms))
+            .subquery())
@@ -1,9 +1,16 @@
 from celery import Celery
 import os
 
+from notifications import deliver
+
 celery_app = Celery('tasks', broker=os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0"))
 
 @celery_app.task
 def send_notification(user_id: str, message: str):
-    # Hozircha oddiy print, Firebase keyin qo‘shiladi
-    print(f"Notification to {user_id}: {message}")
\ No newline at end of file
+    deliver(user_id, [message])
+
+@celery_app.task
+def send_notification_batch(batch: dict):
+    # batch: {user_id: [xabarlar]} — dispatcher bir foydalanuvchi xabarlarini birlashtiradi
+    for user_id, messages in batch.items():
+        deliver(user_id, messages)